@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# admission.py - Per-client accounting, poll rate limits and request priority
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 所有客户端共用同一个线程池，一个以 100 Hz 轮询 ismoving 的客户端会拖慢其他人。这里：
+#   1. 按 ClientID 和来源地址统计请求数、被拒绝数和最近的请求速率（指数衰减平均），
+#      GET /management/v1/clients 查看；
+#   2. [limits] client_poll_rate / addr_poll_rate > 0 时，对 GET 按 ClientID / 来源地址
+#      做令牌桶限速，超出的直接返回 HTTP 429，不进入后面的处理；PUT 命令从不限速；
+#   3. [limits] active_requests > 0 时，同时执行的请求数不超过该值，其余排队，
+#      PUT 命令（halt、move 等）排在所有 GET 轮询前面。长轮询（waitmove、stream）不排队，
+#      否则会长时间占住名额。排队发生在请求已经拿到 worker 线程之后，所以 active_requests
+#      必须小于 worker 数（config.validate 检查），多出来的 worker 就是排队的位置；
+#   4. WSGI 后端上 stream 订阅在整个连接期间占用一个 worker，waitmove 在等待期间占用一个
+#      worker（ASGI 下是执行同步 responder 的线程），同时进行的数量分别受 [limits] max_streams /
+#      max_waits 限制，超出返回 HTTP 503，保证总有 worker 处理其他请求（例如结束运动的 halt）。
+# ClientID 的统计在响应时进行，用 PreProcessRequest 校验过的 req.context.client_id；
+# GET 的限速发生在路由之前，ClientID 直接从 query string 取。
+#
+import math
+import time
+from collections import deque
+from threading import Lock
+from logging import Logger
+
+from falcon import Request, Response, HTTPTooManyRequests, HTTPServiceUnavailable
+
+import metrics
+from config import Config
+from logpolicy import RateLimit
+
+logger: Logger = None
+
+COMMAND = 0             # PUT：halt / move / connected 等
+POLL = 1                # GET
+_PRIORITY_NAMES = ('command', 'poll')
+
+_RATE_TAU = 10.0        # 秒，请求速率的平均时间常数
+_MAX_KEYS = 4096        # 统计表的上限，超过时丢弃空闲的条目
+_IDLE_SEC = 60.0
+_WARN_INTERVAL = 60.0   # 秒，同一个键被限速时最多每隔这么久记一条警告
+_UNGATED = frozenset(('waitmove', 'stream'))
+
+class _Usage:
+    __slots__ = ('requests', 'rejected', 'rate', 'last', 'warned')
+
+    def __init__(self, now: float):
+        self.requests = 0
+        self.rejected = 0
+        self.rate = 0.0
+        self.last = now
+        self.warned = None
+
+    def rate_at(self, now: float) -> float:
+        return self.rate * math.exp((self.last - now) / _RATE_TAU)
+
+class UsageTable:
+    """
+    键（ClientID 或来源地址）-> 请求计数和速率
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._lock = Lock()
+        self._usage = {}
+
+    def _get(self, key, now: float) -> _Usage:
+        u = self._usage.get(key)
+        if u is None:
+            if len(self._usage) >= _MAX_KEYS:
+                self._evict(now)
+            u = self._usage[key] = _Usage(now)
+        return u
+
+    def _evict(self, now: float):
+        idle = [k for k, u in self._usage.items() if now - u.last > _IDLE_SEC]
+        for k in idle:
+            del self._usage[k]
+        if len(self._usage) >= _MAX_KEYS:
+            self._usage.clear()
+
+    def count(self, key, admitted: bool = True):
+        """
+        记一个请求；admitted=False 表示被限速拒绝，此时每个键每 _WARN_INTERVAL 秒最多记一条警告
+        """
+        now = time.monotonic()
+        with self._lock:
+            u = self._get(key, now)
+            u.rate = u.rate_at(now) + 1.0 / _RATE_TAU
+            u.last = now
+            u.requests += 1
+            if admitted:
+                return
+            u.rejected += 1
+            if u.warned is not None and now - u.warned < _WARN_INTERVAL:
+                return
+            u.warned = now
+            rejected = u.rejected
+        logger.warning('[limits] %s %s exceeded the poll rate limit, rejecting excess GETs (%d rejected so far)',
+                       self.kind, key, rejected)
+
+    def top(self, n: int) -> list:
+        now = time.monotonic()
+        with self._lock:
+            rows = [(u.rate_at(now), k, u.requests, u.rejected) for k, u in self._usage.items()]
+        rows.sort(key=lambda r: r[0], reverse=True)
+        return [{self.kind: k, 'Requests': req, 'Rejected': rej, 'Rate': round(rate, 2)}
+                for rate, k, req, rej in rows[:n]]
+
+clients = UsageTable('ClientID')
+addresses = UsageTable('Address')
+
+# ------------------------------------------------------------------
+# 令牌桶：容量等于每秒速率，即允许 1 秒的突发
+# ------------------------------------------------------------------
+_client_limit: RateLimit = None
+_addr_limit: RateLimit = None
+
+def configure():
+    """
+    按 Config 重建限速器；启动时和配置热加载后调用
+    """
+    global _client_limit, _addr_limit
+    _client_limit = RateLimit(Config.client_poll_rate, max_keys=_MAX_KEYS) if Config.client_poll_rate > 0 else None
+    _addr_limit = RateLimit(Config.addr_poll_rate, max_keys=_MAX_KEYS) if Config.addr_poll_rate > 0 else None
+
+configure()
+
+# ------------------------------------------------------------------
+# 按优先级排队的并发名额
+# ------------------------------------------------------------------
+class PriorityGate:
+    """
+    最多 slots 个请求同时执行。名额用完时按优先级排队，同一优先级先到先得；
+    释放时直接把名额交给排在最前的等待者，后来的请求不能插队
+    """
+
+    def __init__(self, slots: int):
+        self._lock = Lock()
+        self._free = slots
+        self._waiting = (deque(), deque())      # 下标即优先级
+
+    def acquire(self, priority: int):
+        with self._lock:
+            if self._free > 0:     # 有空闲名额时一定没有人在排队
+                self._free -= 1
+                return
+            waiter = Lock()
+            waiter.acquire()
+            self._waiting[priority].append(waiter)
+        t0 = time.perf_counter()
+        waiter.acquire()
+        if metrics.enabled:
+            metrics.queue_wait[_PRIORITY_NAMES[priority]].observe(time.perf_counter() - t0)
+
+    def release(self):
+        with self._lock:
+            for queue in self._waiting:
+                if queue:
+                    queue.popleft().release()
+                    return
+            self._free += 1
+
+    def queued(self) -> tuple:
+        with self._lock:
+            return tuple(len(q) for q in self._waiting)
+
+gate: PriorityGate = PriorityGate(Config.active_requests) if Config.active_requests > 0 else None
+
+def call_gated(priority, fn):
+    """
+    在排队名额内执行 fn()；priority 为 None 表示不排队。ASGI 适配层在线程池里用它包装 responder
+    """
+    if gate is None or priority is None:
+        return fn()
+    gate.acquire(priority)
+    try:
+        return fn()
+    finally:
+        gate.release()
+
+# ------------------------------------------------------------------
+# WSGI 后端上长时间占用 worker 的请求的名额
+# ------------------------------------------------------------------
+class LongRequestSlots:
+    """
+    同时进行的数量不超过 Config 里 field 字段的值（运行中修改立即生效），
+    wsgiref 只有一个线程，上限视为 0
+    """
+
+    def __init__(self, field: str, what: str):
+        self._field = field
+        self._what = what
+        self._lock = Lock()
+        self._active = 0
+
+    def limit(self) -> int:
+        return 0 if Config.server == 'wsgiref' else getattr(Config, self._field)
+
+    def acquire(self):
+        """
+        占用一个名额，名额已满时抛 HTTP 503
+        """
+        with self._lock:
+            limit = self.limit()
+            if self._active < limit:
+                self._active += 1
+                return
+        if metrics.enabled:
+            metrics.count_rejected(self._what)
+        raise HTTPServiceUnavailable(title='Service Unavailable',
+                                     description=f'Too many concurrent {self._what} requests '
+                                                 f'({limit} allowed on the {Config.server} server)',
+                                     retry_after=5)
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+    def active(self) -> int:
+        return self._active
+
+    def hold(self, iterable):
+        """
+        把名额交给流式响应：WSGI server 结束响应时调用 close()，在那里释放
+        """
+        return _HeldStream(iterable, self)
+
+class _HeldStream:
+    def __init__(self, iterable, slots: LongRequestSlots):
+        self._iterable = iterable
+        self._slots = slots
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        slots, self._slots = self._slots, None
+        if slots is None:
+            return
+        try:
+            close = getattr(self._iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            slots.release()
+
+streams = LongRequestSlots('max_streams', 'stream')
+waits = LongRequestSlots('max_waits', 'waitmove')
+
+def _query_client_id(req: Request):
+    # 与 PreProcessRequest 一样大小写不敏感；只用作限速的键，不做校验。
+    # 合法的 ClientID 转成 int，与响应时按 req.context.client_id 统计的键一致
+    for k, v in req.params.items():
+        if k.lower() == 'clientid':
+            return int(v) if v.isdigit() else v
+    return None
+
+def _reject(table: UsageTable, key, reason: str):
+    table.count(key, admitted=False)
+    if metrics.enabled:
+        metrics.count_rejected(reason)
+    raise HTTPTooManyRequests(title='Too Many Requests',
+                              description=f'Poll rate limit exceeded for {table.kind} {key}',
+                              retry_after=1)
+
+class AdmissionMiddleware:
+    """
+    Falcon middleware：统计、GET 限速、按优先级排队。
+    async 版本只做统计和限速，排队由 httpserver 在线程池里调用 call_gated 完成，
+    不阻塞事件循环。
+    """
+
+    def _admit(self, req: Request) -> int:
+        addr = req.remote_addr
+        if req.method != 'GET':
+            addresses.count(addr)
+            return COMMAND
+        if _addr_limit is not None and not _addr_limit.on_request(addr):
+            _reject(addresses, addr, 'address')
+        addresses.count(addr)
+        if _client_limit is not None:
+            cid = _query_client_id(req)
+            if cid is not None and not _client_limit.on_request(cid):
+                _reject(clients, cid, 'client')
+        if req.path.rsplit('/', 1)[-1].lower() in _UNGATED:
+            return None
+        return POLL
+
+    def process_request(self, req: Request, resp: Response):
+        priority = self._admit(req)
+        if gate is not None and priority is not None:
+            gate.acquire(priority)
+            req.context.gated = True
+
+    def process_response(self, req: Request, resp: Response, resource, req_succeeded: bool):
+        if getattr(req.context, 'gated', False):
+            req.context.gated = False
+            gate.release()
+        cid = getattr(req.context, 'client_id', None)
+        if cid is not None:
+            clients.count(cid)
+
+    async def process_request_async(self, req: Request, resp: Response):
+        req.context.priority = self._admit(req)
+
+    async def process_response_async(self, req: Request, resp: Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
+
+def status(top: int = 20) -> dict:
+    """
+    GET /management/v1/clients 的返回值：按最近请求速率排序
+    """
+    queued = gate.queued() if gate is not None else (0, 0)
+    return {
+        'Clients': clients.top(top),
+        'Addresses': addresses.top(top),
+        'Queued': dict(zip(('Commands', 'Polls'), queued)),
+        'ClientPollRate': Config.client_poll_rate,
+        'AddressPollRate': Config.addr_poll_rate,
+        'ActiveRequests': Config.active_requests,
+        'Streams': {'Active': streams.active(), 'Limit': streams.limit()},
+        'Waits': {'Active': waits.active(), 'Limit': waits.limit()},
+    }
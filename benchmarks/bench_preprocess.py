@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# bench_preprocess.py - Microbenchmark for per-request pre-processing
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 测量 PreProcessRequest 钩子 + PropertyResponse/MethodResponse 的单请求开销
+# （不含 HTTP server 和 Falcon 路由），用于比较 common.py 的改动前后。
+#
+#   python benchmarks/bench_preprocess.py [-n 20000]
+#
+import os
+import sys
+import time
+import logging
+import argparse
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falcon import Response, RequestOptions, ResponseOptions
+from falcon.testing import create_req
+
+import common
+from common import PreProcessRequest, PropertyResponse, MethodResponse
+
+_FORM = 'application/x-www-form-urlencoded'
+
+# 与 falcon.App 一样在所有请求间共享 options，否则每次构造都会重建 media handlers
+_req_options = RequestOptions()
+_resp_options = ResponseOptions()
+
+def _get_req():
+    return create_req(options=_req_options, method='GET', path='/api/v1/rotator/0/position',
+                      query_string='ClientTransactionID=19&ClientID=4889')
+
+def _put_req():
+    return create_req(options=_req_options, method='PUT', path='/api/v1/rotator/0/moveabsolute',
+                      headers={'Content-Type': _FORM},
+                      body='ClientTransactionID=20&ClientID=4889&Position=12.5')
+
+def _run(make_req, respond, n: int) -> float:
+    hook = PreProcessRequest(0)
+    params = {'devnum': 0}
+    reqs = [make_req() for _ in range(n)]
+    t0 = time.perf_counter()
+    for req in reqs:
+        resp = Response(options=_resp_options)
+        hook(req, resp, None, params)
+        respond(req, resp)
+    return (time.perf_counter() - t0) / n
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', type=int, default=20000, help='requests per case')
+    parser.add_argument('-r', type=int, default=5, help='repeats, best one is reported')
+    args = parser.parse_args()
+
+    # 关闭日志输出，只测解析和序列化
+    lgr = logging.getLogger('bench_preprocess')
+    lgr.addHandler(logging.NullHandler())
+    lgr.propagate = False
+    lgr.setLevel(logging.CRITICAL)
+    common.set_common_logger(lgr)
+
+    def get_respond(req, resp):
+        resp.data = PropertyResponse(12.5, req).data
+
+    def put_respond(req, resp):
+        resp.data = MethodResponse(req).data
+
+    for name, make_req, respond in (('GET position', _get_req, get_respond),
+                                    ('PUT moveabsolute', _put_req, put_respond)):
+        _run(make_req, respond, min(args.n, 1000))  # 预热
+        per_req = min(_run(make_req, respond, args.n) for _ in range(args.r))
+        print(f'{name:18s} {per_req * 1e6:8.2f} us/request')
+
+if __name__ == '__main__':
+    main()
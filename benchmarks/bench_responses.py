@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# bench_responses.py - Response construction and serialization throughput
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 单线程（即每个核）每秒能生成多少个 Alpaca 响应：构造响应对象、序列化、
+# 交给 falcon.Response 并取出 body（resp.render_body），不含 HTTP server 和路由。
+# 对比几种实现：
+#   legacy    原先的写法：实例 __dict__ + 每次新建 Success + json.dumps -> resp.text
+#   json      PropertyResponse(...).data，标准库 json
+#   orjson    PropertyResponse(...).data，orjson（未安装时跳过）
+#   template  ResponseTemplate.render（固定值的属性）
+#
+#   python benchmarks/bench_responses.py [-n 50000]
+#
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from falcon import Response, RequestOptions, ResponseOptions
+from falcon.testing import create_req
+
+import common
+from common import PropertyResponse, MethodResponse, getNextTransId, get_client_transaction_id, log_response
+
+_req_options = RequestOptions()
+_resp_options = ResponseOptions()
+
+class _LegacyError:
+    def __init__(self):
+        self.number = 0
+        self.message = ''
+
+    @property
+    def Number(self) -> int:
+        return self.number
+
+    @property
+    def Message(self) -> str:
+        return self.message
+
+class _LegacyResponse:
+    """
+    改动前的 PropertyResponse，作为对照
+    """
+    def __init__(self, value, req, err=None):
+        err = err or _LegacyError()
+        self.ServerTransactionID = getNextTransId()
+        self.ClientTransactionID = get_client_transaction_id(req, True)
+        self.ErrorNumber = err.Number
+        self.ErrorMessage = err.Message
+        if self.ErrorNumber == 0 and value is not None:
+            self.Value = value
+            log_response(req, value)
+
+    @property
+    def json(self):
+        return json.dumps(self.__dict__)
+
+def _run(respond, n: int) -> float:
+    req = create_req(options=_req_options, method='GET', path='/api/v1/rotator/0/position',
+                     query_string='ClientTransactionID=19&ClientID=4889')
+    req.context.client_transaction_id = 19
+    t0 = time.perf_counter()
+    for _ in range(n):
+        resp = Response(options=_resp_options)
+        respond(req, resp)
+        resp.render_body()
+    return n / (time.perf_counter() - t0)
+
+def main():
+    parser = argparse.ArgumentParser(description='Alpaca response throughput per core')
+    parser.add_argument('-n', type=int, default=50000, help='responses per case')
+    parser.add_argument('-r', type=int, default=5, help='repeats, best one is reported')
+    args = parser.parse_args()
+
+    # 关闭日志输出，只测构造和序列化
+    lgr = logging.getLogger('bench_responses')
+    lgr.addHandler(logging.NullHandler())
+    lgr.propagate = False
+    lgr.setLevel(logging.CRITICAL)
+    common.set_common_logger(lgr)
+
+    template = PropertyResponse.template(12.5)
+
+    def legacy(req, resp):
+        resp.text = _LegacyResponse(12.5, req).json
+
+    def slotted(req, resp):
+        resp.data = PropertyResponse(12.5, req).data
+
+    def method(req, resp):
+        resp.data = MethodResponse(req).data
+
+    def rendered(req, resp):
+        resp.data = template.render(req)
+
+    cases = [('legacy', 'json', legacy), ('property', 'json', slotted), ('method', 'json', method)]
+    try:
+        import orjson
+        cases += [('property', 'orjson', slotted), ('method', 'orjson', method)]
+    except ImportError:
+        print('orjson not installed, skipping the orjson cases', file=sys.stderr)
+    cases.append(('template', 'json', rendered))
+
+    for name, encoder, respond in cases:
+        common.set_json_encoder(encoder)
+        _run(respond, min(args.n, 2000))  # 预热
+        rate = max(_run(respond, args.n) for _ in range(args.r))
+        print(f'{name + "/" + encoder:18s} {rate:12,.0f} responses/s')
+    common.set_json_encoder('json')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# loadgen.py - Load generator / latency benchmark for the Alpaca rotator API
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 按 my_alpaca.log 中观察到的请求比例（大量 ismoving/position 轮询，夹杂少量
+# move/sync/connected 等 PUT）以指定并发压测服务，输出 JSON 格式的吞吐、延迟分位数
+# 和错误统计，便于跟踪性能回归。
+#
+#   python benchmarks/loadgen.py                      # 以子进程启动 main.py 并压测 10 秒
+#   python benchmarks/loadgen.py --inprocess          # 在本进程的线程里启动 main.py
+#   python benchmarks/loadgen.py --url http://host:5555 --concurrency 16 --duration 30
+#   python benchmarks/loadgen.py --mix-from my_alpaca.log --output result.json
+#
+import os
+import re
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各 endpoint 的权重，取自仓库自带 my_alpaca.log 的请求计数
+DEFAULT_MIX = {
+    'ismoving':           441,
+    'position':           335,
+    'mechanicalposition': 11,
+    'targetposition':     1,
+    'stepsize':           1,
+    'reverse':            1,
+    'interfaceversion':   3,
+    'movemechanical':     12,
+    'move':               8,
+    'connected':          8,
+    'sync':               6,
+    'moveabsolute':       6,
+    'halt':               2,
+}
+
+# PUT 端点及其表单参数（除 ClientID/ClientTransactionID 外）
+_PUT_BODIES = {
+    'connected':      lambda rnd: {'Connected': 'True'},
+    'halt':           lambda rnd: {},
+    'move':           lambda rnd: {'Position': f'{rnd.uniform(-30.0, 30.0):.2f}'},
+    'moveabsolute':   lambda rnd: {'Position': f'{rnd.uniform(0.0, 359.9):.2f}'},
+    'movemechanical': lambda rnd: {'Position': f'{rnd.uniform(0.0, 359.9):.2f}'},
+    'sync':           lambda rnd: {'Position': f'{rnd.uniform(0.0, 359.9):.2f}'},
+}
+
+_LOG_REQ = re.compile(r'-> (GET|PUT) /api/v1/rotator/\d+/(\w+)')
+
+def mix_from_log(path: str) -> dict:
+    """
+    统计日志中各 rotator endpoint 的请求次数作为权重
+    """
+    mix = {}
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            m = _LOG_REQ.search(line)
+            if m is None:
+                continue
+            method, endpoint = m.groups()
+            # 只重放 PUT 时我们知道如何构造表单的端点
+            if method == 'PUT' and endpoint not in _PUT_BODIES:
+                continue
+            mix[endpoint] = mix.get(endpoint, 0) + 1
+    if not mix:
+        raise ValueError(f'No rotator requests found in {path}')
+    return mix
+
+def percentile(sorted_vals: list, pct: float) -> float:
+    """
+    nearest-rank 分位数
+    """
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(pct / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+def _latency_summary(vals: list) -> dict:
+    vals = sorted(vals)
+    return {
+        'count': len(vals),
+        'mean': round(sum(vals) / len(vals), 3) if vals else 0.0,
+        'p50': round(percentile(vals, 50), 3),
+        'p90': round(percentile(vals, 90), 3),
+        'p99': round(percentile(vals, 99), 3),
+        'max': round(vals[-1], 3) if vals else 0.0,
+    }
+
+class _Worker(threading.Thread):
+    """
+    一个并发客户端：独占一个 keep-alive 连接，按权重随机选择请求
+    """
+
+    def __init__(self, idx: int, host: str, port: int, mix: dict, devices: int,
+                 stop_at: float, max_requests: int, seed: int):
+        super().__init__(name=f'loadgen-{idx}', daemon=True)
+        self.host, self.port = host, port
+        self.endpoints = list(mix)
+        self.weights = [mix[e] for e in self.endpoints]
+        self.devices = devices
+        self.stop_at = stop_at
+        self.max_requests = max_requests
+        self.rnd = random.Random(seed + idx)
+        self.client_id = 1000 + idx
+        self.ctid = 0
+        self.latencies = {}          # endpoint -> [ms]
+        self.http_errors = {}        # status -> count
+        self.alpaca_errors = {}      # ErrorNumber -> count
+        self.transport_errors = 0
+
+    def _request(self, conn, endpoint: str):
+        self.ctid += 1
+        devnum = self.rnd.randrange(self.devices)
+        path = f'/api/v1/rotator/{devnum}/{endpoint}'
+        ids = {'ClientID': self.client_id, 'ClientTransactionID': self.ctid}
+        if endpoint in _PUT_BODIES:
+            body = urlencode({**ids, **_PUT_BODIES[endpoint](self.rnd)})
+            conn.request('PUT', path, body=body,
+                         headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        else:
+            conn.request('GET', f'{path}?{urlencode(ids)}')
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        done = 0
+        while time.monotonic() < self.stop_at and (self.max_requests <= 0 or done < self.max_requests):
+            endpoint = self.rnd.choices(self.endpoints, self.weights)[0]
+            t0 = time.perf_counter()
+            try:
+                status, data = self._request(conn, endpoint)
+            except (OSError, http.client.HTTPException):
+                self.transport_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                continue
+            self.latencies.setdefault(endpoint, []).append((time.perf_counter() - t0) * 1000.0)
+            done += 1
+            if status != 200:
+                self.http_errors[status] = self.http_errors.get(status, 0) + 1
+                continue
+            try:
+                err = json.loads(data).get('ErrorNumber', 0)
+            except ValueError:
+                err = -1
+            if err:
+                self.alpaca_errors[err] = self.alpaca_errors.get(err, 0) + 1
+        conn.close()
+
+def _wait_port(host: str, port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server at {host}:{port} did not come up within {timeout} s')
+
+def _start_server(inprocess: bool):
+    """
+    启动 main.py，返回 (host, port, stop 函数)。日志写到临时目录，避免覆盖仓库里的 my_alpaca.log
+    """
+    workdir = tempfile.mkdtemp(prefix='loadgen-')
+    if inprocess:
+        sys.path.insert(0, _ROOT)
+        os.chdir(workdir)
+        import main
+        from config import Config
+        threading.Thread(target=main.main, name='server', daemon=True).start()
+        host, port = '127.0.0.1', Config.port
+        _wait_port(host, port, 10.0)
+        return host, port, lambda: None
+
+    sys.path.insert(0, _ROOT)
+    from config import Config
+    proc = subprocess.Popen([sys.executable, os.path.join(_ROOT, 'main.py')], cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    host, port = '127.0.0.1', Config.port
+    try:
+        _wait_port(host, port, 10.0)
+    except RuntimeError:
+        proc.kill()
+        raise
+
+    def stop():
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    return host, port, stop
+
+def _connect_devices(host: str, port: int, devices: int):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    for devnum in range(devices):
+        conn.request('PUT', f'/api/v1/rotator/{devnum}/connected',
+                     body='ClientID=1&ClientTransactionID=0&Connected=True',
+                     headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        conn.getresponse().read()
+    conn.close()
+
+def run_load(host: str, port: int, mix: dict, concurrency: int, duration: float,
+             max_requests: int, devices: int, seed: int) -> dict:
+    _connect_devices(host, port, devices)
+    t0 = time.monotonic()
+    workers = [_Worker(i, host, port, mix, devices, t0 + duration, max_requests, seed)
+               for i in range(concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.monotonic() - t0
+
+    per_endpoint, all_lat = {}, []
+    http_errors, alpaca_errors, transport_errors = {}, {}, 0
+    for w in workers:
+        for ep, vals in w.latencies.items():
+            per_endpoint.setdefault(ep, []).extend(vals)
+            all_lat.extend(vals)
+        for k, v in w.http_errors.items():
+            http_errors[str(k)] = http_errors.get(str(k), 0) + v
+        for k, v in w.alpaca_errors.items():
+            alpaca_errors[str(k)] = alpaca_errors.get(str(k), 0) + v
+        transport_errors += w.transport_errors
+
+    return {
+        'config': {'host': host, 'port': port, 'concurrency': concurrency, 'duration_s': duration,
+                   'max_requests_per_worker': max_requests, 'devices': devices, 'seed': seed, 'mix': mix},
+        'requests': len(all_lat),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(all_lat) / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency_ms': _latency_summary(all_lat),
+        'per_endpoint_ms': {ep: _latency_summary(v) for ep, v in sorted(per_endpoint.items())},
+        'errors': {'http': http_errors, 'alpaca': alpaca_errors, 'transport': transport_errors},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for the Alpaca rotator API')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help='already running server, e.g. http://127.0.0.1:5555')
+    target.add_argument('--inprocess', action='store_true', help='run main.py in a thread of this process')
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--duration', '-d', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--requests', '-n', type=int, default=0, help='max requests per client (0 = unlimited)')
+    parser.add_argument('--devices', type=int, default=1, help='spread requests over devnum 0..N-1')
+    parser.add_argument('--mix-from', help='derive endpoint weights from an Alpaca log file')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--output', '-o', help='write JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    mix = mix_from_log(args.mix_from) if args.mix_from else DEFAULT_MIX
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port, stop = parts.hostname, parts.port or 80, (lambda: None)
+    else:
+        host, port, stop = _start_server(args.inprocess)
+    try:
+        report = run_load(host, port, mix, args.concurrency, args.duration,
+                          args.requests, args.devices, args.seed)
+    finally:
+        stop()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# replay.py - Replay captured my_alpaca.log traffic against a running server
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 解析驱动日志里的请求行（"ADDR -> GET /api/...?..."）、PUT 表单（"ADDR -> {...}"）
+# 和返回值（"ADDR <- value"），按原始时间间隔重新发送：
+#   --speed 1    原速（默认）
+#   --speed 10   10 倍速
+#   --speed 0    不等待，尽快发送
+# 每个原始来源地址一个线程、一个 keep-alive 连接，保持该客户端的请求顺序。
+# 结果以 JSON 输出：回放延迟与日志中原始延迟的对比、发送滞后、返回值不一致的统计。
+#
+#   python benchmarks/replay.py customer.log
+#   python benchmarks/replay.py customer.log --spawn --speed 0 --output replay.json
+#   python benchmarks/replay.py customer.log --url http://10.0.0.5:5555 --filter /rotator/
+#
+import re
+import ast
+import json
+import time
+import argparse
+import threading
+import http.client
+from datetime import datetime
+from urllib.parse import urlsplit, urlencode
+
+from loadgen import _latency_summary, _start_server
+
+_LINE = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d+) \w+ (\S+) (->|<-) (.*)$')
+_REQ = re.compile(r'^(GET|PUT) (/\S*)$')
+
+class Event:
+    """
+    日志中的一个请求
+    """
+    __slots__ = ('t', 'addr', 'method', 'path', 'form', 'expected', 'orig_ms')
+
+    def __init__(self, t: float, addr: str, method: str, path: str):
+        self.t = t
+        self.addr = addr
+        self.method = method
+        self.path = path
+        self.form = None            # PUT 表单
+        self.expected = None        # 日志中记录的返回值文本（只有 GET 有）
+        self.orig_ms = None         # 日志中请求行到返回值的时间差
+
+    @property
+    def endpoint(self) -> str:
+        return self.path.split('?', 1)[0].rsplit('/', 1)[-1].lower()
+
+def _timestamp(text: str) -> float:
+    return datetime.strptime(text, '%Y-%m-%dT%H:%M:%S.%f').timestamp()
+
+def parse_log(path: str, path_filter: str = None) -> list:
+    """
+    解析日志，返回按时间排序的 Event 列表。
+    PUT 表单取同一地址紧随其后的 "->" 字典行；返回值按地址先进先出匹配尚未收到返回值的 GET。
+    没有请求行的返回值（例如 management 接口）被忽略。
+    """
+    flt = re.compile(path_filter) if path_filter else None
+    events = []
+    put_pending = {}                # addr -> 等待表单的 PUT
+    get_pending = {}                # addr -> [等待返回值的 GET]
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            m = _LINE.match(line.rstrip('\r\n'))
+            if m is None:
+                continue
+            ts, addr, arrow, msg = m.groups()
+            t = _timestamp(ts)
+            if arrow == '->':
+                r = _REQ.match(msg)
+                if r is not None:
+                    put_pending.pop(addr, None)
+                    if flt is not None and not flt.search(r.group(2)):
+                        continue
+                    ev = Event(t, addr, r.group(1), r.group(2))
+                    events.append(ev)
+                    if ev.method == 'PUT':
+                        put_pending[addr] = ev
+                    else:
+                        get_pending.setdefault(addr, []).append(ev)
+                    continue
+                ev = put_pending.pop(addr, None)
+                if ev is not None and msg.startswith('{'):
+                    try:
+                        ev.form = ast.literal_eval(msg)
+                    except (ValueError, SyntaxError):
+                        pass
+            else:
+                queue = get_pending.get(addr)
+                if queue:
+                    ev = queue.pop(0)
+                    ev.expected = msg
+                    ev.orig_ms = (t - ev.t) * 1000.0
+    events.sort(key=lambda e: e.t)
+    return events
+
+def _format_value(value) -> str:
+    # 与驱动日志中 "<- %s" 的格式一致
+    return str(value)
+
+class _Client(threading.Thread):
+    """
+    按时间表依次发送同一来源地址的请求
+    """
+
+    def __init__(self, addr: str, events: list, host: str, port: int,
+                 t_first: float, start: float, speed: float):
+        super().__init__(name=f'replay-{addr}', daemon=True)
+        self.events = events
+        self.host, self.port = host, port
+        self.t_first = t_first
+        self.start_at = start
+        self.speed = speed
+        self.results = []           # (event, status, latency_ms, lag_ms, value_text, error_number)
+        self.transport_errors = 0
+
+    def _send(self, conn, ev: Event):
+        if ev.method == 'PUT':
+            conn.request('PUT', ev.path, body=urlencode(ev.form or {}),
+                         headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        else:
+            conn.request('GET', ev.path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        for ev in self.events:
+            lag = 0.0
+            if self.speed > 0:
+                due = self.start_at + (ev.t - self.t_first) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag = -delay * 1000.0
+            t0 = time.perf_counter()
+            try:
+                status, data = self._send(conn, ev)
+            except (OSError, http.client.HTTPException):
+                self.transport_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                continue
+            latency = (time.perf_counter() - t0) * 1000.0
+            value, errnum = None, None
+            if status == 200:
+                try:
+                    body = json.loads(data)
+                    errnum = body.get('ErrorNumber', 0)
+                    if 'Value' in body:
+                        value = _format_value(body['Value'])
+                except ValueError:
+                    pass
+            self.results.append((ev, status, latency, lag, value, errnum))
+        conn.close()
+
+def replay(events: list, host: str, port: int, speed: float, max_mismatches: int = 20) -> dict:
+    if not events:
+        raise ValueError('No requests to replay')
+    by_addr = {}
+    for ev in events:
+        by_addr.setdefault(ev.addr, []).append(ev)
+
+    t_first = events[0].t
+    start = time.monotonic() + 0.1
+    clients = [_Client(addr, evs, host, port, t_first, start, speed) for addr, evs in by_addr.items()]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.monotonic() - start
+
+    replay_ms, orig_ms, lag_ms = {}, {}, []
+    http_errors, alpaca_errors = {}, {}
+    compared, mismatched, samples = 0, {}, []
+    transport_errors = 0
+    for c in clients:
+        transport_errors += c.transport_errors
+        for ev, status, latency, lag, value, errnum in c.results:
+            ep = ev.endpoint
+            replay_ms.setdefault(ep, []).append(latency)
+            if ev.orig_ms is not None:
+                orig_ms.setdefault(ep, []).append(ev.orig_ms)
+            lag_ms.append(lag)
+            if status != 200:
+                http_errors[str(status)] = http_errors.get(str(status), 0) + 1
+                continue
+            if errnum:
+                alpaca_errors[str(errnum)] = alpaca_errors.get(str(errnum), 0) + 1
+            if ev.expected is not None and value is not None:
+                compared += 1
+                if value != ev.expected:
+                    mismatched[ep] = mismatched.get(ep, 0) + 1
+                    if len(samples) < max_mismatches:
+                        samples.append({'path': ev.path, 'logged': ev.expected, 'replayed': value})
+
+    sent = sum(len(v) for v in replay_ms.values())
+    return {
+        'requests': len(events),
+        'sent': sent,
+        'original_duration_s': round(events[-1].t - t_first, 3),
+        'replay_duration_s': round(elapsed, 3),
+        'speed': speed,
+        'throughput_rps': round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+        'schedule_lag_ms': _latency_summary(lag_ms),
+        'latency_ms': {
+            ep: {'replay': _latency_summary(v), 'original': _latency_summary(orig_ms.get(ep, []))}
+            for ep, v in sorted(replay_ms.items())
+        },
+        'errors': {'http': http_errors, 'alpaca': alpaca_errors, 'transport': transport_errors},
+        'responses': {'compared': compared, 'mismatched': mismatched, 'samples': samples},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay Alpaca driver log traffic')
+    parser.add_argument('logfile', help='my_alpaca.log captured from the field')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://127.0.0.1:5555', help='server to replay against')
+    target.add_argument('--spawn', action='store_true', help='start main.py as a subprocess first')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='time scale: 1 = original pacing, 10 = ten times faster, 0 = as fast as possible')
+    parser.add_argument('--filter', help='only replay request paths matching this regex')
+    parser.add_argument('--limit', type=int, default=0, help='replay at most N requests (0 = all)')
+    parser.add_argument('--output', '-o', help='write JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    events = parse_log(args.logfile, args.filter)
+    if args.limit > 0:
+        events = events[:args.limit]
+
+    if args.spawn:
+        host, port, stop = _start_server(False)
+    else:
+        parts = urlsplit(args.url)
+        host, port, stop = parts.hostname, parts.port or 80, (lambda: None)
+    try:
+        report = replay(events, host, port, args.speed)
+    finally:
+        stop()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
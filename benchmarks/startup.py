@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# startup.py - Startup time and import-time breakdown for main.py
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 1. 用 python -X importtime 导入 main，列出 main 直接导入的各模块的累计耗时和
+#    自身耗时最多的模块；
+# 2. 多次以子进程启动 main.py，测量从启动到 HTTP 端口可连接的时间。
+# 结果以 JSON 输出，与 [server] startup_budget_ms 对照。
+#
+#   python benchmarks/startup.py
+#   python benchmarks/startup.py --runs 10 --top 15
+#
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_breakdown(top: int) -> dict:
+    """
+    解析 -X importtime 的输出（微秒）：self | cumulative | 缩进+模块名
+    """
+    code = f'import sys; sys.path.insert(0, {_ROOT!r}); import main'
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=tempfile.mkdtemp(prefix='startup-'), capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cum_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cum_us)))
+
+    # -X importtime 先输出子模块，main 自己那行在它们之后；
+    # main 的直接依赖是它前面、上一个顶层模块之后缩进多一级的那些行
+    idx = next((i for i, r in enumerate(rows) if r[0] == 'main'), None)
+    if idx is None:
+        raise RuntimeError(f'importing main failed:\n{proc.stderr[-2000:]}')
+    start = idx
+    while start > 0 and rows[start - 1][1] > rows[idx][1]:
+        start -= 1
+    children = [r for r in rows[start:idx] if r[1] == rows[idx][1] + 1]
+    total_us = rows[idx][3]
+    return {
+        'total_ms': round(total_us / 1000.0, 1),
+        'main_imports_ms': {name: round(cum / 1000.0, 1)
+                            for name, _, _, cum in sorted(children, key=lambda r: -r[3])},
+        'top_self_ms': {name: round(own / 1000.0, 1)
+                        for name, _, own, _ in sorted(rows, key=lambda r: -r[2])[:top]},
+    }
+
+def time_to_ready(runs: int, port: int) -> dict:
+    """
+    启动 main.py 直到端口可连接的耗时（秒），每次都是新进程
+    """
+    samples = []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix='startup-')
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(_ROOT, 'main.py')], cwd=workdir,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=0.05).close()
+                    break
+                except OSError:
+                    if proc.poll() is not None:
+                        raise RuntimeError(f'main.py exited with code {proc.returncode}')
+                    if time.perf_counter() - t0 > 10.0:
+                        raise RuntimeError('main.py did not open its port within 10 s')
+                    time.sleep(0.002)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+        finally:
+            proc.terminate()
+            proc.wait(5)
+    return {
+        'runs': runs,
+        'min_ms': round(min(samples), 1),
+        'median_ms': round(statistics.median(samples), 1),
+        'max_ms': round(max(samples), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure main.py startup time')
+    parser.add_argument('--runs', '-r', type=int, default=5, help='server start/stop cycles')
+    parser.add_argument('--top', type=int, default=10, help='modules to list by self import time')
+    args = parser.parse_args()
+
+    sys.path.insert(0, _ROOT)
+    from config import Config
+
+    report = {
+        'budget_ms': Config.startup_budget_ms,
+        'imports': import_breakdown(args.top),
+        'time_to_ready': time_to_ready(args.runs, Config.port),
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,13 @@
 # MIT License
 # -----------------------------------------------------------------------------
 import json
+import logging
 from threading import Lock
 from falcon import Request, Response, HTTPBadRequest
 from logging import Logger
 
-from exceptions import Success
+import logpolicy
+from exceptions import SUCCESS
 
 logger: Logger = None
 
@@ -21,6 +23,58 @@ def set_common_logger(lgr):
 
 _bad_title = 'Bad Alpaca Request'
 
+# ------------------------------------------------------------------
+# 响应的 JSON 序列化，由 [server] json_encoder 选择：
+#   json   标准库；固定字段直接按 ResponseTemplate 的方式拼 bytes，只有 Value 走 json.dumps
+#   orjson 可选依赖，整个响应一次序列化
+# 两者都输出 bytes，直接赋给 resp.data
+# ------------------------------------------------------------------
+_encode_str = json.encoder.encode_basestring_ascii
+_INF = float('inf')
+
+def _encode_value(value) -> bytes:
+    # 常见的 bool / 有限 float / int 直接格式化，与 json.dumps 结果相同；其余交给 json.dumps
+    t = type(value)
+    if t is bool:
+        return b'true' if value else b'false'
+    if t is float and -_INF < value < _INF:
+        return float.__repr__(value).encode()
+    if t is int:
+        return b'%d' % value
+    return json.dumps(value).encode()
+
+def _encode_json(r) -> bytes:
+    head = b'{"ServerTransactionID": %d, "ClientTransactionID": %d, "ErrorNumber": %d, "ErrorMessage": %s' % (
+        r.ServerTransactionID, r.ClientTransactionID, r.ErrorNumber, _encode_str(r.ErrorMessage).encode())
+    if r.Value is None:
+        return head + b'}'
+    return head + b', "Value": ' + _encode_value(r.Value) + b'}'
+
+def _encode_orjson(r) -> bytes:
+    return _orjson_dumps(r.to_dict())
+
+_orjson_dumps = None
+encode_response = _encode_json
+
+def set_json_encoder(name: str) -> str:
+    """
+    选择响应的序列化实现，返回实际使用的名字。auto 表示装了 orjson 就用，否则用标准库
+    """
+    global encode_response, _orjson_dumps
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if name == 'orjson':
+                logger.error('[server] json_encoder = "orjson" requires the orjson package')
+                raise
+        else:
+            _orjson_dumps = orjson.dumps
+            encode_response = _encode_orjson
+            return 'orjson'
+    encode_response = _encode_json
+    return 'json'
+
 def to_bool(val_str: str) -> bool:
     # 只接受 "true" / "false"
     val = val_str.lower()
@@ -29,44 +83,105 @@ def to_bool(val_str: str) -> bool:
                              description=f'Invalid boolean value "{val_str}"')
     return val == 'true'
 
+def get_request_form(req: Request) -> dict:
+    """
+    取 PUT 的表单数据。ASGI 模式下表单由适配层预先 await 并放在 req.context.form
+    """
+    form = getattr(req.context, 'form', None)
+    if form is None:
+        form = req.get_media()
+    return form
+
+def fold_request_fields(req: Request) -> dict:
+    """
+    一次性生成小写键名的参数视图：GET 取 query params，其余取 form (PUT body)。
+    大小写不同的重复键只保留第一个，与逐个扫描的结果一致。
+    """
+    src = req.params if req.method == 'GET' else get_request_form(req)
+    folded = {k.lower(): v for k, v in src.items()}
+    if len(folded) != len(src):
+        folded = {}
+        for k, v in src.items():
+            folded.setdefault(k.lower(), v)
+    return folded
+
+def get_request_fields(req: Request) -> dict:
+    """
+    取本请求的小写键名参数视图，第一次调用时生成并缓存在 req.context.fields
+    """
+    fields = getattr(req.context, 'fields', None)
+    if fields is None:
+        fields = req.context.fields = fold_request_fields(req)
+    return fields
+
 def get_request_field(name: str, req: Request, caseless: bool=False, default=None) -> str:
     """
     从 query params 或者 form (PUT body) 中获取指定字段
     如果 default=None 表示该字段必填，否则抛 400。
+    GET 总是大小写不敏感；PUT 在 caseless=False 时要求键名完全一致且值非空。
     """
-    bad_desc = f'Missing/empty parameter "{name}"'
-    lower_name = name.lower()
-
-    if req.method == 'GET':
-        for k, v in req.params.items():
-            if k.lower() == lower_name:
-                return v
-        if default is None:
-            raise HTTPBadRequest(title=_bad_title, description=bad_desc)
-        return default
-
+    if req.method == 'GET' or caseless:
+        val = get_request_fields(req).get(name.lower())
+        if val is not None:
+            return val
     else:  # PUT
-        formdata = req.get_media()
-        if caseless:
-            for k in formdata.keys():
-                if k.lower() == lower_name:
-                    return formdata[k]
-        else:
-            if name in formdata and formdata[name] != '':
-                return formdata[name]
+        val = get_request_form(req).get(name)
+        if val is not None and val != '':
+            return val
 
-        if default is None:
-            raise HTTPBadRequest(title=_bad_title, description=bad_desc)
-        return default
+    if default is None:
+        raise HTTPBadRequest(title=_bad_title, description=f'Missing/empty parameter "{name}"')
+    return default
 
-def log_request(req: Request):
-    msg = f'{req.remote_addr} -> {req.method} {req.path}'
+def get_client_transaction_id(req: Request, caseless: bool) -> int:
+    """
+    响应里回填的 ClientTransactionID。经过 PreProcessRequest 的请求直接用钩子里
+    解析好的 req.context.client_transaction_id（大小写不敏感）
+    """
+    if caseless:
+        ctid = getattr(req.context, 'client_transaction_id', None)
+        if ctid is not None:
+            return ctid
+    return int(get_request_field('ClientTransactionID', req, caseless, '0'))
+
+def _log_request_line(req: Request):
     if req.query_string:
-        msg += f'?{req.query_string}'
-    logger.info(msg)
+        logger.info('%s -> %s %s?%s', req.remote_addr, req.method, req.path, req.query_string)
+    else:
+        logger.info('%s -> %s %s', req.remote_addr, req.method, req.path)
 
     if req.method == 'PUT' and req.content_length != 0:
-        logger.info(f'{req.remote_addr} -> {req.media}')
+        logger.info('%s -> %s', req.remote_addr, get_request_form(req))
+
+def log_request(req: Request):
+    # 级别关闭时不做任何拼接；参数交给 handler 格式化（异步模式下在日志线程里完成）
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    policy = logpolicy.get_policy(req.path)
+    if policy is not None:
+        # 按 [logging.policy] 采样/限速；change 策略要等返回值，请求行推迟到 log_response
+        decision = policy.on_request((req.remote_addr, req.path))
+        req.context.log_decision = decision
+        if decision is None:
+            # 记住本次用的策略对象，期间配置热加载替换了策略也不影响这个请求
+            req.context.log_policy = policy
+            return
+        if not decision:
+            return
+    _log_request_line(req)
+
+def log_response(req: Request, value):
+    """
+    记录返回值，与同一请求的 log_request 决定保持一致
+    """
+    decision = getattr(req.context, 'log_decision', True)
+    if decision is None:
+        if not req.context.log_policy.on_value((req.remote_addr, req.path), value):
+            return
+        _log_request_line(req)
+    elif not decision:
+        return
+    logger.info('%s <- %s', req.remote_addr, value)
 
 class PreProcessRequest:
     """
@@ -76,12 +191,14 @@ class PreProcessRequest:
     def __init__(self, maxdev):
         self.maxdev = maxdev
 
-    def _pos_or_zero(self, val: str) -> bool:
+    def _pos_or_zero(self, val: str) -> int:
+        """
+        解析为非负整数，不合法时返回 -1
+        """
         try:
-            test = int(val)
-            return test >= 0
+            return int(val)
         except ValueError:
-            return False
+            return -1
 
     def _check_request(self, req: Request, devnum: int):
         if devnum > self.maxdev:
@@ -89,24 +206,33 @@ class PreProcessRequest:
             logger.error(msg)
             raise HTTPBadRequest(title=_bad_title, description=msg)
 
+        # 整个请求只解析一次参数，后续 get_request_field / 响应对象都复用 req.context.fields
+        fields = req.context.fields = fold_request_fields(req)
+
         # ClientID
-        cid = get_request_field('ClientID', req, caseless=True, default=None)
+        cid = fields.get('clientid')
         if cid is None:
             msg = 'Missing Alpaca ClientID'
             logger.error(msg)
-            raise HTTPBadRequest(title=_bad_title, description=msg)
-        if not self._pos_or_zero(cid):
+            raise HTTPBadRequest(title=_bad_title, description='Missing/empty parameter "ClientID"')
+        cid_val = self._pos_or_zero(cid)
+        if cid_val < 0:
             msg = f'Invalid ClientID {cid}'
             logger.error(msg)
             raise HTTPBadRequest(title=_bad_title, description=msg)
 
         # ClientTransactionID
-        ctid = get_request_field('ClientTransactionID', req, caseless=True, default='0')
-        if not self._pos_or_zero(ctid):
+        ctid = fields.get('clienttransactionid', '0')
+        ctid_val = self._pos_or_zero(ctid)
+        if ctid_val < 0:
             msg = f'Invalid ClientTransactionID {ctid}'
             logger.error(msg)
             raise HTTPBadRequest(title=_bad_title, description=msg)
 
+        # 校验通过后保存在 req.context，供后续响应直接使用
+        req.context.client_id = cid_val
+        req.context.client_transaction_id = ctid_val
+
     def __call__(self, req: Request, resp: Response, resource, params):
         log_request(req)
         self._check_request(req, params['devnum'])
@@ -114,48 +240,127 @@ class PreProcessRequest:
 # 线程安全的全局自增
 _tid_lock = Lock()
 _tid = 0
+_tid_step = 1
+_tid_marks = None   # 多进程模式：各 worker 已发出的最大 ID（共享内存），_tid_index 是本进程的下标
+_tid_index = 0
 def getNextTransId() -> int:
     global _tid
     with _tid_lock:
-        _tid += 1
+        _tid += _tid_step
+        if _tid_marks is not None:
+            _tid_marks[_tid_index] = _tid
         return _tid
 
-class PropertyResponse:
+def set_trans_id_stride(index: int, count: int, marks=None):
     """
-    处理 GET 属性请求的 JSON 返回
+    多进程模式：第 index 个 worker（共 count 个）依次分配 index+1, index+1+count, ...，
+    各进程的 ServerTransactionID 互不重复。
+    marks 是主进程持有的共享数组，记录每个 worker 已发出的最大 ID；重启的 worker 从那里接着分配，
+    不会重复上一个进程已经发出的 ID
+    """
+    global _tid, _tid_step, _tid_marks, _tid_index
+    with _tid_lock:
+        last = marks[index] if marks is not None else 0
+        _tid = last if last else index + 1 - count
+        _tid_step = count
+        _tid_marks = marks
+        _tid_index = index
+
+class ResponseTemplate:
     """
-    def __init__(self, value, req: Request, err=Success()):
+    预先序列化的响应：除 ServerTransactionID / ClientTransactionID 外其余字段固定，
+    每次请求只把两个事务 ID 拼到预编码好的 bytes 前面，不再构造对象和 json.dumps。
+    字段顺序与 PropertyResponse / MethodResponse 的输出一致。
+    """
+    def __init__(self, value=None, err=SUCCESS, caseless: bool = True):
+        self.value = value
+        self.caseless = caseless
+        self.error_number = err.Number
+        body = {'ErrorNumber': err.Number, 'ErrorMessage': err.Message}
+        if err.Number == 0 and value is not None:
+            body['Value'] = value
+        self._has_value = 'Value' in body
+        # json.dumps 的结果去掉开头的 '{'，接在事务 ID 之后
+        self._tail = (', ' + json.dumps(body)[1:]).encode()
+
+    def render(self, req: Request) -> bytes:
+        stid = getNextTransId()
+        ctid = get_client_transaction_id(req, self.caseless)
+        if self._has_value:
+            log_response(req, self.value)
+        elif self.error_number != 0:
+            req.context.error_number = self.error_number
+        return b'{"ServerTransactionID": %d, "ClientTransactionID": %d' % (stid, ctid) + self._tail
+
+class _Response:
+    """
+    PropertyResponse / MethodResponse 的公共部分：固定字段用 __slots__ 存放，不建实例 __dict__；
+    序列化时按 Alpaca 字段顺序组装，没有返回值时不输出 Value
+    """
+    __slots__ = ('ServerTransactionID', 'ClientTransactionID', 'ErrorNumber', 'ErrorMessage', 'Value')
+
+    def __init__(self, req: Request, caseless: bool, err, value):
         self.ServerTransactionID = getNextTransId()
-        # GET 情况下，ClientTransactionID 大小写不敏感，但若没给就默认为0
-        self.ClientTransactionID = int(get_request_field('ClientTransactionID', req, True, '0'))
+        self.ClientTransactionID = get_client_transaction_id(req, caseless)
 
-        self.ErrorNumber = err.Number
+        self.ErrorNumber = number = err.Number
         self.ErrorMessage = err.Message
-
+        if number != 0:
+            req.context.error_number = number   # 供 metrics 按 ErrorNumber 统计
+            value = None
         # 如果无错误，可以返回 Value；若有错误，最好不要返回空值
-        if self.ErrorNumber == 0 and value is not None:
-            self.Value = value
-            logger.info(f'{req.remote_addr} <- {value}')
+        self.Value = value
+        if value is not None:
+            log_response(req, value)
+
+    def to_dict(self) -> dict:
+        body = {
+            'ServerTransactionID': self.ServerTransactionID,
+            'ClientTransactionID': self.ClientTransactionID,
+            'ErrorNumber': self.ErrorNumber,
+            'ErrorMessage': self.ErrorMessage,
+        }
+        if self.Value is not None:
+            body['Value'] = self.Value
+        return body
 
     @property
-    def json(self):
-        return json.dumps(self.__dict__)
+    def data(self) -> bytes:
+        """
+        用 set_json_encoder 选定的实现序列化，直接赋给 resp.data，省去 Falcon 对 resp.text 的再编码
+        """
+        return encode_response(self)
+
+class PropertyResponse(_Response):
+    """
+    处理 GET 属性请求的 JSON 返回
+    """
+    __slots__ = ()
+
+    def __init__(self, value, req: Request, err=SUCCESS):
+        # GET 情况下，ClientTransactionID 大小写不敏感，但若没给就默认为0
+        super().__init__(req, True, err, value)
+
+    @staticmethod
+    def template(value, err=SUCCESS) -> ResponseTemplate:
+        """
+        值固定不变的属性，用预序列化模板代替每次构造 PropertyResponse
+        """
+        return ResponseTemplate(value, err, caseless=True)
 
-class MethodResponse:
+class MethodResponse(_Response):
     """
     处理 PUT 方法请求的 JSON 返回
     """
-    def __init__(self, req: Request, err=Success(), value=None):
-        self.ServerTransactionID = getNextTransId()
-        # PUT 情况下，若字段名大小写不对，则默认0
-        self.ClientTransactionID = int(get_request_field('ClientTransactionID', req, False, '0'))
+    __slots__ = ()
 
-        self.ErrorNumber = err.Number
-        self.ErrorMessage = err.Message
-        if self.ErrorNumber == 0 and value is not None:
-            self.Value = value
-            logger.info(f'{req.remote_addr} <- {value}')
+    def __init__(self, req: Request, err=SUCCESS, value=None):
+        # PUT 情况下，若字段名大小写不对，则默认0
+        super().__init__(req, False, err, value)
 
-    @property
-    def json(self):
-        return json.dumps(self.__dict__)
+    @staticmethod
+    def template(err=SUCCESS, value=None) -> ResponseTemplate:
+        """
+        结果固定不变的方法，用预序列化模板代替每次构造 MethodResponse
+        """
+        return ResponseTemplate(value, err, caseless=False)
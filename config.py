@@ -9,8 +9,10 @@
 import sys
 import toml
 import logging
+import importlib.util
 
-_dict = toml.load(f'{sys.path[0]}/config.toml')  # 如果找不到文件会抛异常
+CONFIG_PATH = f'{sys.path[0]}/config.toml'
+_dict = toml.load(CONFIG_PATH)  # 如果找不到文件会抛异常
 
 def get_toml(sect: str, item: str):
     return _dict[sect][item]
@@ -19,15 +21,115 @@ class Config:
     # 从 config.toml 中对应字段加载
     ip_address: str = get_toml('network', 'ip_address')
     port: int = get_toml('network', 'port')
+    server: str = get_toml('network', 'server')
+    threads: int = get_toml('network', 'threads')
+    processes: int = get_toml('network', 'processes')
+    keep_alive: bool = get_toml('network', 'keep_alive')
+    keepalive_timeout: float = get_toml('network', 'keepalive_timeout')
+    discovery_ipv6: bool = get_toml('network', 'discovery_ipv6')
+    discovery_rate: float = get_toml('network', 'discovery_rate')
 
     location: str = get_toml('server', 'location')
     verbose_driver_exceptions: bool = get_toml('server', 'verbose_driver_exceptions')
+    metrics: bool = get_toml('server', 'metrics')
+    startup_budget_ms: int = get_toml('server', 'startup_budget_ms')
+    config_poll_sec: float = get_toml('server', 'config_poll_sec')
+    json_encoder: str = get_toml('server', 'json_encoder')
 
+    client_poll_rate: float = get_toml('limits', 'client_poll_rate')
+    addr_poll_rate: float = get_toml('limits', 'addr_poll_rate')
+    active_requests: int = get_toml('limits', 'active_requests')
+    max_streams: int = get_toml('limits', 'max_streams')
+    max_waits: int = get_toml('limits', 'max_waits')
+
+    num_devices: int = get_toml('device', 'num_devices')
     can_reverse: bool = get_toml('device', 'can_reverse')
     step_size: float = get_toml('device', 'step_size')
     steps_per_sec: int = get_toml('device', 'steps_per_sec')
+    motion_model: str = get_toml('device', 'motion_model')
+    read_coalesce: float = get_toml('device', 'read_coalesce')
+    move_queue: int = get_toml('device', 'move_queue')
+    acceleration: float = get_toml('device', 'acceleration')
 
     log_level: int = logging.getLevelName(get_toml('logging', 'log_level'))
     log_to_stdout: bool = get_toml('logging', 'log_to_stdout')
     max_size_mb: int = get_toml('logging', 'max_size_mb')
     num_keep_logs: int = get_toml('logging', 'num_keep_logs')
+    log_async: bool = get_toml('logging', 'async')
+    log_queue_size: int = get_toml('logging', 'queue_size')
+    log_policy: dict = get_toml('logging', 'policy')
+
+MOTION_MODELS = ('stepped', 'analytic', 'trapezoid', 'scurve')     # 与 rotatorcontroller._MOTION_MODELS 一致
+JSON_ENCODERS = ('auto', 'json', 'orjson')
+
+def read_config() -> type:
+    """
+    重新解析 config.toml，返回一个新的 Config 类；当前生效的 Config 不受影响。
+    缺少字段或 TOML 语法错误时抛异常
+    """
+    spec = importlib.util.spec_from_file_location('_config_reload', __file__)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod.Config
+
+def validate(cfg: type):
+    """
+    检查取值范围，不合法时抛 ValueError
+    """
+    if not isinstance(cfg.log_level, int):
+        raise ValueError(f'Unknown [logging] log_level: {cfg.log_level}')
+    if cfg.step_size <= 0:
+        raise ValueError(f'[device] step_size must be > 0, got {cfg.step_size}')
+    if cfg.steps_per_sec <= 0:
+        raise ValueError(f'[device] steps_per_sec must be > 0, got {cfg.steps_per_sec}')
+    if cfg.processes < 1:
+        raise ValueError(f'[network] processes must be >= 1, got {cfg.processes}')
+    if cfg.client_poll_rate < 0 or cfg.addr_poll_rate < 0:
+        raise ValueError('[limits] poll rates must be >= 0')
+    if cfg.keepalive_timeout <= 0:
+        raise ValueError(f'[network] keepalive_timeout must be > 0, got {cfg.keepalive_timeout}')
+    if cfg.active_requests < 0:
+        raise ValueError(f'[limits] active_requests must be >= 0, got {cfg.active_requests}')
+    # 请求拿到 worker 线程之后才排队，名额不少于 worker 数时永远不会排队；wsgiref 只有一个线程
+    workers = 1 if cfg.server == 'wsgiref' else cfg.threads
+    if 0 < workers <= cfg.active_requests:
+        raise ValueError(f'[limits] active_requests ({cfg.active_requests}) must be less than the number of '
+                         f'workers ({workers} on the {cfg.server} server), otherwise requests never queue')
+    if cfg.max_streams < 0 or cfg.max_waits < 0:
+        raise ValueError('[limits] max_streams / max_waits must be >= 0')
+    # 长时间占用 worker 的请求加起来必须少于 worker 数，留下的 worker 处理 halt 等其他请求；
+    # ASGI 的 stream 是协程，不占 worker
+    held = cfg.max_waits + (cfg.max_streams if cfg.server == 'threaded' else 0)
+    if cfg.server != 'wsgiref' and held >= cfg.threads:
+        raise ValueError(f'[limits] max_waits + max_streams ({held}) must be less than [network] threads '
+                         f'({cfg.threads}), otherwise long-polls can occupy every worker')
+    if cfg.num_devices < 1:
+        raise ValueError(f'[device] num_devices must be >= 1, got {cfg.num_devices}')
+    if cfg.json_encoder not in JSON_ENCODERS:
+        raise ValueError(f'[server] json_encoder must be one of {", ".join(JSON_ENCODERS)}')
+    if cfg.move_queue < 0:
+        raise ValueError(f'[device] move_queue must be >= 0, got {cfg.move_queue}')
+    if cfg.read_coalesce < 0:
+        raise ValueError(f'[device] read_coalesce must be >= 0, got {cfg.read_coalesce}')
+    if cfg.motion_model not in MOTION_MODELS:
+        raise ValueError(f'[device] motion_model must be one of {", ".join(MOTION_MODELS)}')
+    if cfg.acceleration <= 0:
+        raise ValueError(f'[device] acceleration must be > 0, got {cfg.acceleration}')
+
+def diff(cfg: type) -> dict:
+    """
+    cfg 中与当前 Config 不同的字段：{字段名: (旧值, 新值)}
+    """
+    changed = {}
+    for name in Config.__annotations__:
+        old, new = getattr(Config, name), getattr(cfg, name)
+        if old != new:
+            changed[name] = (old, new)
+    return changed
+
+def apply(cfg: type, names):
+    """
+    把 cfg 中指定的字段写入 Config
+    """
+    for name in names:
+        setattr(Config, name, getattr(cfg, name))
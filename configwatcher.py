@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# configwatcher.py - Hot reload of config.toml
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 后台线程每隔 [server] config_poll_sec 秒检查 config.toml 的修改时间，变化后：
+#   1. 重新解析并校验（语法错误、缺少字段、取值非法时整体放弃，保持原配置）；
+#      在线字段还要和运行中的启动字段一起校验（例如 max_waits 对比实际的线程数）；
+#   2. 把可在线生效的字段写入 Config，并应用到运行中的对象：
+#        [device] step_size / steps_per_sec / can_reverse /
+#                 move_queue / acceleration                 -> 每个 RotatorDevice.configure()
+#        [logging] log_level                                -> driverlog.set_level()
+#        [logging.policy]                                   -> logpolicy.policies 整体替换
+#        [limits] client_poll_rate / addr_poll_rate         -> admission.configure()
+#      其余按需读取 Config 的字段（location、verbose_driver_exceptions、keep_alive、read_coalesce、
+#      max_streams、max_waits）自然生效；
+#   3. 只在启动时读取的字段（端口、server、线程数、设备数量等）不写入 Config，记录警告，重启后才生效。
+#
+import os
+from threading import Thread, Event
+from logging import Logger
+
+import config
+import admission
+import driverlog
+import logpolicy
+import rotatorcontroller
+from config import Config
+
+logger: Logger = None
+
+# 修改后无需重启即可生效的字段
+LIVE_FIELDS = frozenset((
+    'step_size', 'steps_per_sec', 'can_reverse', 'move_queue', 'acceleration', 'read_coalesce',
+    'log_level', 'log_policy',
+    'client_poll_rate', 'addr_poll_rate', 'max_streams', 'max_waits',
+    'location', 'verbose_driver_exceptions', 'keep_alive', 'startup_budget_ms',
+))
+
+def reload() -> bool:
+    """
+    重新加载 config.toml 并应用，返回是否成功
+    """
+    try:
+        new = config.read_config()
+        config.validate(new)
+        # 线程数、server 等重启才生效，新的在线字段要和运行中的值一起校验
+        config.validate(type('_Effective', (new,), {name: getattr(Config, name)
+                                                    for name in Config.__annotations__
+                                                    if name not in LIVE_FIELDS}))
+        policies = logpolicy.build_policies(new.log_policy)
+    except Exception as ex:
+        logger.error('Config reload rejected, keeping the running configuration: %s: %s',
+                     type(ex).__name__, ex)
+        return False
+
+    changed = config.diff(new)
+    if not changed:
+        return True
+    # 只在启动时读取的字段保持运行中的值，Config 始终反映实际生效的配置
+    config.apply(new, changed.keys() & LIVE_FIELDS)
+
+    if changed.keys() & {'step_size', 'steps_per_sec', 'can_reverse', 'move_queue', 'acceleration'}:
+        rotatorcontroller.configure_devices()
+    if 'log_level' in changed:
+        driverlog.set_level(Config.log_level)
+    if 'log_policy' in changed:
+        logpolicy.policies = policies
+    if changed.keys() & {'client_poll_rate', 'addr_poll_rate'}:
+        admission.configure()
+
+    for name, (old, val) in sorted(changed.items()):
+        if name in LIVE_FIELDS:
+            logger.info('Config reloaded: %s %r -> %r', name, old, val)
+        else:
+            logger.warning('Config changed: %s %r -> %r (takes effect after restart)', name, old, val)
+    return True
+
+class ConfigWatcher(Thread):
+    """
+    按修改时间轮询 config.toml（不依赖 inotify，Windows 上同样可用）
+    """
+
+    def __init__(self, path: str, interval: float):
+        Thread.__init__(self, name='ConfigWatcher', daemon=True)
+        self.path = path
+        self.interval = interval
+        self._stop_event = Event()
+        self._mtime = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            mtime = self._stat()
+            if mtime is None or mtime == self._mtime:
+                continue
+            self._mtime = mtime
+            reload()
+
+    def stop(self):
+        self._stop_event.set()
+
+def start_watcher():
+    """
+    config_poll_sec > 0 时启动后台检查线程
+    """
+    if Config.config_poll_sec <= 0:
+        return None
+    watcher = ConfigWatcher(config.CONFIG_PATH, Config.config_poll_sec)
+    watcher.start()
+    return watcher
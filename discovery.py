@@ -7,51 +7,133 @@
 # MIT License
 # -----------------------------------------------------------------------------
 import os
+import time
 import socket
+import struct
+import selectors
 from threading import Thread
 from logging import Logger
 
+from config import Config
+from logpolicy import RateLimit
+
 logger: Logger = None
 
+DISCOVERY_PORT = 32227
+DISCOVERY_GROUP_V6 = 'ff12::a1:9aca'    # Alpaca 规范的 IPv6 组播地址
+_SUMMARY_INTERVAL = 60.0                # 秒，汇总日志的间隔
+_MAX_BATCH = 64                         # 每次可读时最多连续处理的报文数
+
 class DiscoveryResponder(Thread):
     """
     通过监听 32227 UDP 来响应 "alpacadiscovery1" 消息，返回当前服务所在的 port。
+    IPv4 广播和 IPv6 组播（ff12::a1:9aca，所有网卡）由同一个线程用 selectors 处理；
+    回复只编码一次，按来源地址限速，逐包日志降为 DEBUG，另外定期输出一行汇总。
     """
 
     def __init__(self, ADDR, PORT):
         Thread.__init__(self, name='Discovery')
 
-        self.device_address = (ADDR, 32227)
-        self.alpaca_response = "{\"AlpacaPort\": " + str(PORT) + "}"
-        self.rsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.rsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.alpaca_response = f'{{"AlpacaPort": {PORT}}}'.encode()
+        self._limiter = RateLimit(Config.discovery_rate, max_keys=4096)
+        self._sel = selectors.DefaultSelector()
+        self._answered = 0
+        self._limited = 0
+        self._ignored = 0
+
+        self._sel.register(self._bind_v4(ADDR), selectors.EVENT_READ)
+        if Config.discovery_ipv6 and not ADDR:
+            sock = self._bind_v6()
+            if sock is not None:
+                self._sel.register(sock, selectors.EVENT_READ)
+
+        self.daemon = True
+        self.start()
+
+    def _bind_v4(self, addr: str) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         if os.name != 'nt':
-            self.rsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         try:
-            self.rsock.bind(self.device_address)
+            sock.bind((addr, DISCOVERY_PORT))
         except:
             logger.error('DiscoveryResponder: failed to bind receive socket')
-            self.rsock.close()
-            self.rsock = 0
+            sock.close()
             raise
+        sock.setblocking(False)
+        return sock
 
-        self.tsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.tsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    def _bind_v6(self):
+        """
+        绑定 [::]:32227 并在每个网卡上加入 ff12::a1:9aca；系统不支持 IPv6 时返回 None
+        """
+        if not socket.has_ipv6:
+            return None
         try:
-            self.tsock.bind((ADDR, 0))
-        except:
-            logger.error('DiscoveryResponder: failed to bind send socket')
-            self.tsock.close()
-            self.tsock = 0
-            raise
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        except OSError as ex:
+            logger.warning('DiscoveryResponder: IPv6 unavailable (%s)', ex)
+            return None
+        try:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if os.name != 'nt':
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(('::', DISCOVERY_PORT))
+        except OSError as ex:
+            logger.warning('DiscoveryResponder: failed to bind IPv6 socket (%s)', ex)
+            sock.close()
+            return None
 
-        self.daemon = True
-        self.start()
+        group = socket.inet_pton(socket.AF_INET6, DISCOVERY_GROUP_V6)
+        joined = 0
+        for index, name in socket.if_nameindex():
+            try:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP,
+                                group + struct.pack('@I', index))
+                joined += 1
+            except OSError as ex:
+                logger.debug('DiscoveryResponder: cannot join %s on %s (%s)', DISCOVERY_GROUP_V6, name, ex)
+        if not joined:
+            logger.warning('DiscoveryResponder: no interface joined %s', DISCOVERY_GROUP_V6)
+        sock.setblocking(False)
+        return sock
+
+    def _handle(self, sock: socket.socket):
+        # 一次可读事件里把积压的报文都处理掉（最多 _MAX_BATCH 个），突发时少做系统调用
+        for _ in range(_MAX_BATCH):
+            try:
+                data, addr = sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as ex:
+                logger.debug('DiscoveryResponder: recvfrom failed (%s)', ex)
+                return
+            if b'alpacadiscovery1' not in data:
+                self._ignored += 1
+                continue
+            if not self._limiter.on_request(addr[0]):
+                self._limited += 1
+                continue
+            logger.debug('Discovery received %r from %s', data, addr)
+            try:
+                sock.sendto(self.alpaca_response, addr)
+                self._answered += 1
+            except OSError as ex:
+                logger.debug('DiscoveryResponder: sendto %s failed (%s)', addr, ex)
+
+    def _log_summary(self):
+        if self._answered or self._limited or self._ignored:
+            logger.info('Discovery: answered %d, rate-limited %d, ignored %d in the last %d s',
+                        self._answered, self._limited, self._ignored, _SUMMARY_INTERVAL)
+            self._answered = self._limited = self._ignored = 0
 
     def run(self):
+        next_summary = time.monotonic() + _SUMMARY_INTERVAL
         while True:
-            data, addr = self.rsock.recvfrom(1024)
-            datastr = data.decode('ascii', errors='ignore')
-            logger.info(f'Discovery received "{datastr}" from {addr}')
-            if 'alpacadiscovery1' in datastr:
-                self.tsock.sendto(self.alpaca_response.encode(), addr)
+            for key, _ in self._sel.select(max(0.0, next_summary - time.monotonic())):
+                self._handle(key.fileobj)
+            if time.monotonic() >= next_summary:
+                self._log_summary()
+                next_summary += _SUMMARY_INTERVAL
@@ -6,14 +6,88 @@
 #
 # MIT License
 # -----------------------------------------------------------------------------
+import atexit
 import logging
 import logging.handlers
+import queue
 import time
 
 from config import Config
 
 logger = None  # 全局单例
 
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    异步日志：请求线程只把 LogRecord 放进有界队列，格式化和磁盘 I/O（含 rollover）
+    都在 QueueListener 线程里完成。队列满时丢弃并计数，不阻塞请求线程。
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同进程队列，无需像默认实现那样提前 format；msg/args 留给监听线程再拼接
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+class WorkerQueueHandler(DroppingQueueHandler):
+    """
+    多进程模式的 worker 进程：LogRecord 要跨进程 pickle，所以在本进程里先格式化消息
+    （加上进程名前缀），时间戳和级别仍由主进程的 formatter 输出
+    """
+    prepare = logging.handlers.QueueHandler.prepare
+
+_queue_handler: DroppingQueueHandler = None
+_listener: logging.handlers.QueueListener = None
+_worker_listener: logging.handlers.QueueListener = None
+
+def queue_stats() -> dict:
+    """
+    异步日志队列的统计；同步模式下返回 None
+    """
+    if _queue_handler is None:
+        return None
+    q = _queue_handler.queue
+    try:
+        pending = q.qsize()
+    except NotImplementedError:  # multiprocessing.Queue 在 macOS 上不支持 qsize()
+        pending = 0
+    return {
+        'enqueued': _queue_handler.enqueued,
+        'dropped': _queue_handler.dropped,
+        'pending': pending,
+        'max_size': getattr(q, 'maxsize', None) or getattr(q, '_maxsize', 0),
+    }
+
+def _stop_listener():
+    global _listener, _worker_listener
+    if _worker_listener is not None:
+        _worker_listener.stop()
+        _worker_listener = None
+    if _listener is not None:
+        _listener.stop()  # 把队列里剩余的记录写完
+        _listener = None
+
+def set_level(level: int):
+    """
+    运行中修改日志级别（logger 以及所有 handler，包括异步模式下监听线程里的）
+    """
+    logger.setLevel(level)
+    logging.getLogger().setLevel(level)
+    handlers = list(logger.handlers) + list(logging.getLogger().handlers)
+    if _listener is not None:
+        handlers += list(_listener.handlers)
+    for h in handlers:
+        h.setLevel(level)
+
 def init_logging():
     logging.basicConfig(level=Config.log_level)
     logger = logging.getLogger('myalpaca')  # 你可以自定义任何名字
@@ -52,4 +126,57 @@ def init_logging():
     fh.doRollover()  # 启动时先滚动一次，让日志文件从0开始
     logger.addHandler(fh)
 
+    if Config.log_async:
+        _start_async(logger)
+
+    return logger
+
+def _start_async(logger: logging.Logger):
+    """
+    把 logger（以及 basicConfig 给 root 加的 handler）的输出改由 QueueListener 线程完成
+    """
+    global _queue_handler, _listener
+    handlers = list(logger.handlers) + list(logging.getLogger().handlers)
+    for h in logger.handlers[:]:
+        logger.removeHandler(h)
+    logger.propagate = False
+
+    q = queue.Queue(maxsize=Config.log_queue_size)
+    _queue_handler = DroppingQueueHandler(q)
+    logger.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+
+def _output_handlers() -> list:
+    """
+    实际写日志的 handler（文件、stdout），异步模式下它们挂在 QueueListener 上
+    """
+    if _listener is not None:
+        return list(_listener.handlers)
+    return [h for h in list(logger.handlers) + list(logging.getLogger().handlers)
+            if not isinstance(h, logging.handlers.QueueHandler)]
+
+def listen_worker_logs(q):
+    """
+    主进程：把各 worker 进程经 multiprocessing.Queue 发来的日志写到同一组 handler
+    """
+    global _worker_listener
+    _worker_listener = logging.handlers.QueueListener(q, *_output_handlers(), respect_handler_level=True)
+    _worker_listener.start()
+    atexit.register(_stop_listener)
+
+def init_worker_logging(q) -> logging.Logger:
+    """
+    worker 进程：日志只放进与主进程共享的队列，不直接写文件
+    """
+    global _queue_handler
+    logger = logging.getLogger('myalpaca')
+    logger.setLevel(Config.log_level)
+    logger.propagate = False
+    for h in logger.handlers[:]:
+        logger.removeHandler(h)
+    _queue_handler = WorkerQueueHandler(q)
+    _queue_handler.setFormatter(logging.Formatter('[%(processName)s] %(message)s'))
+    logger.addHandler(_queue_handler)
     return logger
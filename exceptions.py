@@ -6,26 +6,24 @@
 #
 # MIT License
 # -----------------------------------------------------------------------------
-import traceback
 from config import Config
 from logging import Logger
 
 logger: Logger = None
 
 class Success:
-    def __init__(self):
-        self.number: int = 0
-        self.message: str = ''
+    """
+    无错误。不可变，所有响应共用同一个实例 SUCCESS
+    """
+    __slots__ = ()
+    Number: int = 0
+    Message: str = ''
 
-    @property
-    def Number(self) -> int:
-        return self.number
-
-    @property
-    def Message(self) -> str:
-        return self.message
+SUCCESS = Success()
 
 class ActionNotImplementedException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'The requested action is not implemented in this driver.'):
         self.number = 0x40C
         self.message = message
@@ -40,6 +38,8 @@ class ActionNotImplementedException:
         return self.message
 
 class DriverException:
+    __slots__ = ('number', 'fullmsg')
+
     def __init__(self, number: int = 0x500, message: str = 'Internal driver error.', exc=None):
         if number <= 0x500 or number >= 0xFFF:
             logger.error(f'Bad DriverException number {hex(number)}, use 0x500 instead.')
@@ -48,6 +48,7 @@ class DriverException:
         self.number = number
         if exc is not None:
             if Config.verbose_driver_exceptions:
+                import traceback  # 只在出错时才需要，不放在启动路径上
                 self.fullmsg = f'{self.__class__.__name__}: {message}\n{traceback.format_exc()}'
             else:
                 self.fullmsg = f'{self.__class__.__name__}: {message}\n{type(exc).__name__}: {str(exc)}'
@@ -65,6 +66,8 @@ class DriverException:
         return self.fullmsg
 
 class InvalidOperationException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'The requested operation cannot be done at this time.'):
         self.number = 0x40B
         self.message = message
@@ -79,6 +82,8 @@ class InvalidOperationException:
         return self.message
 
 class InvalidValueException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'Invalid value given.'):
         self.number = 0x401
         self.message = message
@@ -93,6 +98,8 @@ class InvalidValueException:
         return self.message
 
 class NotConnectedException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'The device is not connected.'):
         self.number = 0x407
         self.message = message
@@ -107,6 +114,8 @@ class NotConnectedException:
         return self.message
 
 class NotImplementedException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'Property or method not implemented.'):
         self.number = 0x400
         self.message = message
@@ -121,6 +130,8 @@ class NotImplementedException:
         return self.message
 
 class ParkedException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'Illegal operation while parked.'):
         self.number = 0x408
         self.message = message
@@ -135,6 +146,8 @@ class ParkedException:
         return self.message
 
 class SlavedException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'Illegal operation while slaved.'):
         self.number = 0x409
         self.message = message
@@ -149,6 +162,8 @@ class SlavedException:
         return self.message
 
 class ValueNotSetException:
+    __slots__ = ('number', 'message')
+
     def __init__(self, message: str = 'The value has not yet been set.'):
         self.number = 0x402
         self.message = message
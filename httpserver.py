@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# httpserver.py - Selectable HTTP server backends
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 根据 config.toml 中 [network] server 的取值选择服务端：
+#   wsgiref  - 原始的单线程 wsgiref.simple_server（一次只处理一个请求）
+#   threaded - 线程池 WSGI server，支持 HTTP/1.1 keep-alive
+#   asgi     - Falcon asgi.App + uvicorn（可选依赖），同步 resource 放到线程池执行
+#
+import time
+import socket
+import asyncio
+import selectors
+from collections import deque
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler, make_server
+
+import falcon
+import falcon.asgi
+from falcon import App
+
+import admission
+import profiling
+from config import Config
+
+SERVER_BACKENDS = ('wsgiref', 'threaded', 'asgi')
+
+# ------------------------------------------------------------------
+# 自定义 WSGI Request Handler，用于在非200返回时进行额外日志处理
+# ------------------------------------------------------------------
+class LoggingWSGIRequestHandler(WSGIRequestHandler):
+    """
+    在 Python wsgiref.SimpleServer 之上做简单的封装，
+    可以定制非200状态时的日志行为。
+    """
+
+    def log_message(self, format: str, *args):
+        # 如果你想记录非 200 返回，可以解开下面注释
+        # if args[1] != '200':
+        #     driverlog.logger.info(f'{self.client_address[0]} <- {format % args}')
+        pass
+
+class _ReusePortMixin:
+    """
+    reuse_port=True 时监听 socket 设置 SO_REUSEPORT（多进程模式）。
+    socketserver 的 allow_reuse_port 要 Python 3.11 才支持，这里在 bind 之前自己设置
+    """
+    reuse_port = False
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+# ------------------------------------------------------------------
+# 线程池 + keep-alive 的 WSGI server
+# ------------------------------------------------------------------
+class _BodyReader:
+    """
+    限定长度的 wsgi.input，请求结束后把应用没读完的 body 丢弃，
+    保证同一连接上的下一个请求从正确位置开始解析。
+    """
+
+    def __init__(self, rfile, length: int):
+        self._rfile = rfile
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._rfile.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._rfile.readline(size)
+        self._remaining -= len(data)
+        return data
+
+    def readlines(self, hint: int = -1) -> list:
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        while self._remaining > 0:
+            if not self.read(min(self._remaining, 65536)):
+                break
+
+class _KeepAliveServerHandler(ServerHandler):
+    http_version = '1.1'
+    reusable = False
+
+    def close(self):
+        # close() 会清空 headers，先记录本次响应结束后连接能否复用：
+        # 没有 Content-Length 的响应只能靠关闭连接来界定结尾
+        headers = self.headers
+        self.reusable = headers is not None and 'Content-Length' in headers \
+            and headers.get('Connection', '').lower() != 'close'
+        super().close()
+
+class KeepAliveWSGIRequestHandler(LoggingWSGIRequestHandler):
+    """
+    HTTP/1.1 持久连接：handle() 处理已经到达的请求（包括流水线发来的），
+    之后连接若还要保持，就不再占着线程池 worker 等下一个请求，而是交还给
+    ThreadPoolWSGIServer 放进空闲连接的 selector，下一个请求到达时再提交到线程池。
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = Config.keepalive_timeout
+    # 响应头和 body 分两次写出，长连接上 Nagle + 延迟 ACK 会让每个请求多等几十毫秒
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._pending():
+            self.handle_one_request()
+
+    def _pending(self) -> bool:
+        """
+        下一个请求是否已经到达（缓冲区或 socket 里有数据），不阻塞
+        """
+        self.connection.settimeout(0.0)
+        try:
+            return bool(self.rfile.peek(1))
+        except (BlockingIOError, ConnectionError):
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def finish(self):
+        # 连接保持时只把响应写完，rfile / wfile 留给下一次 handle()
+        if self.close_connection:
+            super().finish()
+        else:
+            self.wfile.flush()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if not self.parse_request():  # 已经发送了错误码
+            self.close_connection = True
+            return
+        if not Config.keep_alive or self.request_version != 'HTTP/1.1':
+            self.close_connection = True
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        body = _BodyReader(self.rfile, length)
+        handler = _KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=True,
+        )
+        handler.request_handler = self      # backpointer for logging
+        handler.run(self.server.get_app())
+
+        if not handler.reusable:
+            self.close_connection = True
+            return
+        try:
+            body.drain()
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+
+class _IdleConnections:
+    """
+    空闲的 keep-alive 连接：由一个线程用 selector 等待下一个请求到达，可读时把连接
+    提交到线程池；空闲超过 keepalive_timeout 秒的连接直接关闭。
+    登记/注销只在 selector 线程里做，其他线程经 _pending 队列交过来并用 socketpair 唤醒它。
+    """
+
+    def __init__(self, server):
+        self._server = server
+        self._sel = selectors.DefaultSelector()
+        self._lock = Lock()
+        self._pending = deque()
+        self._closed = False
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ)
+        Thread(target=self._run, name='http-idle', daemon=True).start()
+
+    def park(self, handler):
+        with self._lock:
+            if self._closed:
+                self._server.close_connection(handler)
+                return
+            self._pending.append(handler)
+        try:
+            self._wake_w.send(b'\0')
+        except BlockingIOError:     # 唤醒字节还没读走，selector 线程本来就会醒
+            pass
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._wake_w.send(b'\0')
+
+    def _run(self):
+        sel, server = self._sel, self._server
+        timeout = Config.keepalive_timeout
+        tick = min(1.0, timeout)
+        while True:
+            for key, _ in sel.select(tick):
+                if key.fileobj is self._wake_r:
+                    try:
+                        self._wake_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                sel.unregister(key.fileobj)
+                server.resume(key.data[0])
+            with self._lock:
+                parked, self._pending = self._pending, deque()
+                closed = self._closed
+            now = time.monotonic()
+            for handler in parked:
+                sel.register(handler.connection, selectors.EVENT_READ, (handler, now + timeout))
+            for key in list(sel.get_map().values()):
+                if key.fileobj is self._wake_r:
+                    continue
+                if closed or key.data[1] <= now:
+                    sel.unregister(key.fileobj)
+                    server.close_connection(key.data[0])
+            if closed:
+                sel.close()
+                self._wake_r.close()
+                self._wake_w.close()
+                return
+
+class ThreadPoolWSGIServer(_ReusePortMixin, WSGIServer):
+    """
+    与 socketserver.ThreadingMixIn 类似，但请求交给固定大小的线程池处理，
+    避免每个连接新建线程，也限制了最大并发数。
+    线程池 worker 只在处理请求时占用；keep-alive 连接空闲时交给 _IdleConnections，
+    所以同时保持的连接数不受 threads 限制。
+    """
+    # socketserver 默认的 listen backlog 只有 5，许多客户端同时连接时多出来的要等 SYN 重传（1 秒）
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, server_address, handler_class, workers: int, reuse_port: bool = False):
+        self.reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        self._idle = _IdleConnections(self)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._release(handler)
+
+    def resume(self, handler):
+        """
+        空闲连接上到达了下一个请求
+        """
+        self._pool.submit(self._resume_worker, handler)
+
+    def _resume_worker(self, handler):
+        try:
+            handler.handle()
+            handler.finish()
+        except Exception:
+            handler.close_connection = True
+            self.handle_error(handler.request, handler.client_address)
+        self._release(handler)
+
+    def _release(self, handler):
+        if handler.close_connection:
+            self.shutdown_request(handler.request)
+        else:
+            self._idle.park(handler)
+
+    def close_connection(self, handler):
+        """
+        关闭一个空闲的 keep-alive 连接
+        """
+        handler.close_connection = True
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def server_close(self):
+        super().server_close()
+        self._idle.close()
+        self._pool.shutdown(wait=False)
+
+# ------------------------------------------------------------------
+# ASGI：把现有同步 resource / 钩子包装成协程
+# ------------------------------------------------------------------
+class _AsyncResource:
+    """
+    把同步 Falcon resource 适配为 ASGI responder。
+    PUT 的表单先在事件循环里 await 出来放进 req.context.form，
+    然后把原 responder（含 @before 钩子）放到线程池里执行，按 admission 的优先级排队。
+    """
+
+    def __init__(self, resource, executor: ThreadPoolExecutor):
+        self._resource = resource
+        self._executor = executor
+        for method in falcon.COMBINED_METHODS:
+            name = f'on_{method.lower()}'
+            responder = getattr(resource, name, None)
+            if callable(responder):
+                setattr(self, name, self._wrap(responder))
+
+    def _wrap(self, responder):
+        executor = self._executor
+
+        async def on_request(req, resp, **params):
+            if req.method != 'GET':
+                # 空 body 也在这里得到 {}，同步代码不会碰到需要 await 的 get_media()
+                req.context.form = await req.get_media(default_when_empty={})
+            loop = asyncio.get_running_loop()
+            priority = getattr(req.context, 'priority', None)
+            await loop.run_in_executor(executor, profiling.profile_call,
+                                       lambda: admission.call_gated(priority, lambda: responder(req, resp, **params)))
+
+        return on_request
+
+class SyncResourceASGIApp(falcon.asgi.App):
+    """
+    falcon.asgi.App，add_route/add_error_handler 接受原有的同步 resource 与处理函数，
+    这样 main.py 的路由注册代码在两种模式下保持一致。
+    """
+
+    def __init__(self, workers: int, **kwargs):
+        super().__init__(**kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi')
+
+    def add_route(self, uri_template: str, resource, **kwargs):
+        super().add_route(uri_template, _AsyncResource(resource, self._executor), **kwargs)
+
+    def add_error_handler(self, exception, handler=None):
+        if handler is not None and not asyncio.iscoroutinefunction(handler):
+            sync_handler = handler
+
+            async def handler(req, resp, ex, params, ws=None):
+                sync_handler(req, resp, ex, params)
+
+        super().add_error_handler(exception, handler)
+
+# ------------------------------------------------------------------
+# 对外接口
+# ------------------------------------------------------------------
+def _check_backend():
+    if Config.server not in SERVER_BACKENDS:
+        raise ValueError(f'Unknown [network] server "{Config.server}", '
+                         f'expected one of {", ".join(SERVER_BACKENDS)}')
+
+def create_app(middleware=None):
+    """
+    按配置返回 falcon.App（WSGI）或可挂载同步 resource 的 asgi.App
+    """
+    _check_backend()
+    if Config.server == 'asgi':
+        return SyncResourceASGIApp(Config.threads, middleware=middleware)
+    return App(middleware=middleware)
+
+def _reuse_port_socket() -> socket.socket:
+    """
+    uvicorn 没有 SO_REUSEPORT 选项，多进程时自己建好监听 socket 再把 fd 交给它
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((Config.ip_address or '0.0.0.0', Config.port))
+    sock.listen(socket.SOMAXCONN)
+    return sock
+
+def serve_forever(app, logger, reuse_port: bool = False):
+    """
+    按配置启动对应的 server，阻塞直到进程退出。
+    reuse_port=True 时监听 socket 设置 SO_REUSEPORT，多个进程可以监听同一个端口
+    """
+    _check_backend()
+    if Config.server == 'asgi':
+        try:
+            import uvicorn
+        except ImportError:
+            logger.error('[network] server = "asgi" requires the uvicorn package')
+            raise
+        logger.info(f'==STARTUP== Serving (asgi) on {Config.ip_address}:{Config.port} (UTC timestamps).')
+        kwargs = {'fd': _reuse_port_socket().fileno()} if reuse_port else \
+                 {'host': Config.ip_address or '0.0.0.0', 'port': Config.port}
+        uvicorn.run(app, timeout_keep_alive=int(Config.keepalive_timeout) if Config.keep_alive else 0,
+                    log_config=None, access_log=False, **kwargs)
+        return
+
+    if Config.server == 'threaded':
+        httpd = make_server(Config.ip_address, Config.port, app,
+                            server_class=lambda addr, hcls: ThreadPoolWSGIServer(addr, hcls, Config.threads,
+                                                                                 reuse_port),
+                            handler_class=KeepAliveWSGIRequestHandler)
+    else:
+        server_class = type('ReusePortWSGIServer', (_ReusePortMixin, WSGIServer), {'reuse_port': True}) \
+            if reuse_port else WSGIServer
+        httpd = make_server(Config.ip_address, Config.port, app, server_class=server_class,
+                            handler_class=LoggingWSGIRequestHandler)
+    with httpd:
+        logger.info(f'==STARTUP== Serving ({Config.server}) on {Config.ip_address}:{Config.port} (UTC timestamps).')
+        httpd.serve_forever()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# logpolicy.py - Per-endpoint request logging policies
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 在 config.toml 的 [logging.policy] 中按 endpoint 名（URL 最后一段）配置：
+#   all        每个请求都记录（默认）
+#   every:N    每个客户端每 N 个请求记录一次
+#   change     只在返回值与该客户端上次记录的不同时才记录
+#   rate:X     每个客户端每秒最多记录 X 个请求
+# “客户端”以 (remote_addr, 请求路径) 区分，不同设备编号互不影响。
+# 这些键在设备编号校验之前就会记录，每个策略最多保留 MAX_KEYS 个键，超出时清空重来。
+#
+import time
+from threading import Lock
+
+from config import Config
+
+MAX_KEYS = 4096
+
+class EveryNth:
+    def __init__(self, n: int, max_keys: int = 0):
+        if n < 1:
+            raise ValueError(f'every:N needs N >= 1, got {n}')
+        self.n = n
+        self.max_keys = max_keys
+        self._lock = Lock()
+        self._count = {}
+
+    def on_request(self, key) -> bool:
+        with self._lock:
+            if self.max_keys and len(self._count) >= self.max_keys and key not in self._count:
+                self._count.clear()
+            count = self._count.get(key, 0)
+            self._count[key] = count + 1
+        return count % self.n == 0
+
+class OnChange:
+    _MISSING = object()
+
+    def __init__(self, max_keys: int = 0):
+        self.max_keys = max_keys
+        self._lock = Lock()
+        self._last = {}
+
+    def on_request(self, key):
+        return None  # 要等拿到返回值才能决定
+
+    def on_value(self, key, value) -> bool:
+        with self._lock:
+            if self._last.get(key, self._MISSING) == value:
+                return False
+            if self.max_keys and len(self._last) >= self.max_keys and key not in self._last:
+                self._last.clear()
+            self._last[key] = value
+            return True
+
+class RateLimit:
+    """
+    令牌桶：容量 max(X, 1)，每秒补充 X 个。X < 1 时容量仍为 1，即每 1/X 秒放行一个。
+    max_keys > 0 时键的数量超过上限就清空重来（例如来源地址被伪造的 UDP 洪泛）
+    """
+
+    def __init__(self, rate: float, max_keys: int = 0):
+        if rate <= 0:
+            raise ValueError(f'rate:X needs X > 0, got {rate}')
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.max_keys = max_keys
+        self._lock = Lock()
+        self._buckets = {}
+
+    def on_request(self, key) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self.max_keys and len(self._buckets) >= self.max_keys and key not in self._buckets:
+                self._buckets.clear()
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                return True
+            self._buckets[key] = (tokens, now)
+            return False
+
+def parse_policy(spec: str):
+    """
+    把 config.toml 里的策略字符串转成策略对象；'all' 返回 None
+    """
+    kind, _, arg = spec.strip().lower().partition(':')
+    if kind == 'all' and not arg:
+        return None
+    if kind == 'change' and not arg:
+        return OnChange(max_keys=MAX_KEYS)
+    try:
+        if kind == 'every':
+            return EveryNth(int(arg), max_keys=MAX_KEYS)
+        if kind == 'rate':
+            return RateLimit(float(arg), max_keys=MAX_KEYS)
+    except ValueError as ex:
+        raise ValueError(f'Bad [logging.policy] value "{spec}": {ex}') from None
+    raise ValueError(f'Bad [logging.policy] value "{spec}", '
+                     f'expected all / every:N / change / rate:X')
+
+def build_policies(specs: dict) -> dict:
+    """
+    解析整个 [logging.policy] 表，任何一项不合法都抛 ValueError
+    """
+    return {endpoint.lower(): policy
+            for endpoint, policy in ((e, parse_policy(s)) for e, s in specs.items())
+            if policy is not None}
+
+# endpoint 名 -> 策略对象，启动时从配置解析；配置热加载时整体替换
+policies = build_policies(Config.log_policy)
+
+def get_policy(path: str):
+    """
+    按请求路径的最后一段查找策略，没有配置时返回 None（全部记录）
+    """
+    if not policies:
+        return None
+    return policies.get(path.rsplit('/', 1)[-1].lower())
@@ -11,10 +11,10 @@
 # Edit History:
 #   2025-03- (your date)  Migrated from the original Alpaca template
 #
+import time
+_T_START = time.perf_counter()  # 启动计时从导入其他模块之前开始
+
 import sys
-import traceback
-import inspect
-from wsgiref.simple_server import WSGIRequestHandler, make_server
 
 import falcon
 from falcon import Request, Response, App, HTTPInternalServerError
@@ -26,6 +26,15 @@ import management
 import setupcontroller
 import driverlog
 import rotatorcontroller
+import httpserver
+import motion
+import metrics
+import profiling
+import admission
+import configwatcher
+import multiproc
+import common
+import config
 
 from config import Config
 from discovery import DiscoveryResponder
@@ -36,39 +45,20 @@ from common import set_common_logger
 # ------------------------------------------------------------------
 API_VERSION = 1
 
-# ------------------------------------------------------------------
-# 自定义 WSGI Request Handler，用于在非200返回时进行额外日志处理
-# ------------------------------------------------------------------
-class LoggingWSGIRequestHandler(WSGIRequestHandler):
-    """
-    在 Python wsgiref.SimpleServer 之上做简单的封装，
-    可以定制非200状态时的日志行为。
-    """
-
-    def log_message(self, format: str, *args):
-        # 如果你想记录非 200 返回，可以解开下面注释
-        # if args[1] != '200':
-        #     driverlog.logger.info(f'{self.client_address[0]} <- {format % args}')
-        pass
-
 # ------------------------------------------------------------------
 # 动态为某个“设备类型”模块下的类生成路由
 # ------------------------------------------------------------------
 def init_routes(app: App, devname: str, module):
     """
-    从某个模块中找到所有类（假设都是 Falcon resource 类），
-    并添加路由规则到 falcon.App 对象中。
+    按模块里的 ROUTES 表（Falcon resource 类）添加路由规则到 falcon.App 对象中。
     假定路由格式为 /api/v1/<devname>/<devnum>/<class_name_lower>
     """
-    memlist = inspect.getmembers(module, inspect.isclass)
-    for cname, ctype in memlist:
-        # 只处理在该 module 中定义的类
-        if ctype.__module__ == module.__name__:
-            # 将类名小写作为 endpoint
-            app.add_route(
-                f'/api/v{API_VERSION}/{devname}/{{devnum:int(min=0)}}/{cname.lower()}',
-                ctype()
-            )
+    for ctype in module.ROUTES:
+        # 将类名小写作为 endpoint
+        app.add_route(
+            f'/api/v{API_VERSION}/{devname}/{{devnum:int(min=0)}}/{ctype.__name__.lower()}',
+            ctype()
+        )
 
 # ------------------------------------------------------------------
 # 处理 falcon 中尚未被捕获的异常，记录日志并返回 500
@@ -83,6 +73,7 @@ def custom_excepthook(exc_type, exc_value, exc_traceback):
     driverlog.logger.error(exc_value)
 
     if Config.verbose_driver_exceptions and exc_traceback:
+        import traceback  # 只在出错时才需要，不放在启动路径上
         format_exception = traceback.format_tb(exc_traceback)
         for line in format_exception:
             driverlog.logger.error(repr(line))
@@ -95,24 +86,40 @@ def falcon_uncaught_exception_handler(req: Request, resp: Response, ex: BaseExce
 # ------------------------------------------------------------------
 # 主启动函数
 # ------------------------------------------------------------------
-def main():
-    # 初始化日志
-    logger = driverlog.init_logging()
+def set_module_loggers(logger):
     driverlog.logger = logger
     exceptions.logger = logger
     discovery.logger = logger
+    motion.logger = logger
+    profiling.logger = logger
+    configwatcher.logger = logger
+    multiproc.logger = logger
+    admission.logger = logger
     set_common_logger(logger)
-    # 让 rotator 设备的逻辑准备就绪
-    rotatorcontroller.start_rot_device(logger)
 
-    # 用于兜底处理 “最后机会” 异常
-    sys.excepthook = custom_excepthook
-
-    # 启动发现应答
-    _DSC = DiscoveryResponder(Config.ip_address, Config.port)
+def check_config(logger):
+    """
+    启动时按热加载的同一套规则校验 config.toml，不合法时记录错误并退出
+    """
+    try:
+        config.validate(Config)
+    except ValueError as ex:
+        logger.critical('==STARTUP== Invalid config.toml, not starting: %s', ex)
+        raise SystemExit(f'Invalid config.toml: {ex}')
 
-    # 构造 Falcon APP
-    falc_app = App()
+def build_app():
+    """
+    构造 Falcon APP（WSGI 或 ASGI，取决于 [network] server）并注册全部路由
+    """
+    encoder = common.set_json_encoder(Config.json_encoder)
+    driverlog.logger.info('==STARTUP== JSON encoder: %s', encoder)
+    # 性能采集中间件放在最前面，采集范围包括其他中间件
+    middleware = [profiling.ProfilingMiddleware()]
+    if Config.metrics:
+        middleware.append(metrics.MetricsMiddleware())
+    # 统计/限速/排队放在 metrics 之后，排队时间计入请求耗时
+    middleware.append(admission.AdmissionMiddleware())
+    falc_app = httpserver.create_app(middleware=middleware)
     # 注册各类 “ASCOM设备” 路由
     init_routes(falc_app, 'rotator', rotatorcontroller)
 
@@ -120,18 +127,76 @@ def main():
     falc_app.add_route('/management/apiversions', management.apiversions())
     falc_app.add_route(f'/management/v{API_VERSION}/description', management.description())
     falc_app.add_route(f'/management/v{API_VERSION}/configureddevices', management.configureddevices())
+    falc_app.add_route(f'/management/v{API_VERSION}/profile', management.profile())
+    falc_app.add_route(f'/management/v{API_VERSION}/clients', management.clients())
     # setup
+    if Config.metrics:
+        falc_app.add_route('/metrics', metrics.metrics())
     falc_app.add_route('/setup', setupcontroller.svrsetup())
-    falc_app.add_route(f'/setup/v{API_VERSION}/rotator/{{devnum}}/setup', setupcontroller.devsetup())
+    # 最后一条路由注册时就编译路由表（Falcon 默认推迟到第一个请求）
+    falc_app.add_route(f'/setup/v{API_VERSION}/rotator/{{devnum}}/setup', setupcontroller.devsetup(),
+                       compile=True)
 
     # 钩子： Falcon 中处理未捕获异常
     falc_app.add_error_handler(Exception, falcon_uncaught_exception_handler)
+    return falc_app
+
+def log_startup_time(logger, t_imported: float):
+    t_ready = time.perf_counter()
+    total_ms = (t_ready - _T_START) * 1000.0
+    logger.info('==STARTUP== Initialized in %.0f ms (imports %.0f ms, setup %.0f ms)',
+                total_ms, (t_imported - _T_START) * 1000.0, (t_ready - t_imported) * 1000.0)
+    if total_ms > Config.startup_budget_ms:
+        logger.warning('==STARTUP== Startup took %.0f ms, over the %d ms budget '
+                       '(see benchmarks/startup.py for an import-time breakdown)',
+                       total_ms, Config.startup_budget_ms)
+
+def worker_main(index: int, count: int, shared, tids, conn, log_queue):
+    """
+    [network] processes > 1 时每个 worker 进程的入口（由 multiproc 以 spawn 方式启动）：
+    设备状态读共享内存，命令交给主进程，自己只跑 HTTP server
+    """
+    t_imported = time.perf_counter()
+    logger = driverlog.init_worker_logging(log_queue)
+    set_module_loggers(logger)
+    check_config(logger)
+    multiproc.attach_worker(index, count, shared, tids, conn)
+    sys.excepthook = custom_excepthook
+    configwatcher.start_watcher()
+
+    falc_app = build_app()
+    log_startup_time(logger, t_imported)
+    httpserver.serve_forever(falc_app, logger, reuse_port=True)
+
+def main():
+    t_imported = time.perf_counter()
+    # 初始化日志
+    logger = driverlog.init_logging()
+    set_module_loggers(logger)
+    check_config(logger)
+
+    # 用于兜底处理 “最后机会” 异常
+    sys.excepthook = custom_excepthook
+
+    if Config.processes > 1:
+        # 设备、发现应答和日志文件留在本进程，HTTP 交给 worker 进程
+        multiproc.run_owner(worker_main)
+        return
+
+    # 让 rotator 设备的逻辑准备就绪
+    rotatorcontroller.start_rot_device(logger)
+
+    # 监视 config.toml，修改后在线生效
+    configwatcher.start_watcher()
+
+    # 启动发现应答
+    _DSC = DiscoveryResponder(Config.ip_address, Config.port)
+
+    falc_app = build_app()
+    log_startup_time(logger, t_imported)
 
-    # 启动 wsgi server
-    with make_server(Config.ip_address, Config.port, falc_app,
-                     handler_class=LoggingWSGIRequestHandler) as httpd:
-        logger.info(f'==STARTUP== Serving on {Config.ip_address}:{Config.port} (UTC timestamps).')
-        httpd.serve_forever()
+    # 启动 http server
+    httpserver.serve_forever(falc_app, logger)
 
 if __name__ == '__main__':
     main()
@@ -9,18 +9,23 @@
 import falcon
 from falcon import Request, Response
 
-from common import PropertyResponse
+from common import PropertyResponse, MethodResponse, get_request_field, to_bool
 from config import Config
+from exceptions import InvalidValueException, InvalidOperationException
 from logging import Logger
 
+import admission
+import profiling
+import rotatorcontroller
 from rotatorcontroller import RotatorMetadata
 
 logger: Logger = None
 
+_apiversions_resp = PropertyResponse.template([1])  # 可以根据需要添加更多版本
+
 class apiversions:
     def on_get(self, req: Request, resp: Response):
-        apis = [1]  # 可以根据需要添加更多版本
-        resp.text = PropertyResponse(apis, req).json
+        resp.data = _apiversions_resp.render(req)
 
 class description:
     def on_get(self, req: Request, resp: Response):
@@ -30,17 +35,53 @@ class description:
             'Version'      : TelescopeMetadata.Version,
             'Location'     : Config.location
         }
-        resp.text = PropertyResponse(desc, req).json
+        resp.data = PropertyResponse(desc, req).data
 
 class configureddevices:
     def on_get(self, req: Request, resp: Response):
-        # 如果有多个 device，可以把它们都加入列表
+        # 每个已配置的 rotator 实例一项
         confarray = [
             {
                 'DeviceName':     RotatorMetadata.Name,
                 'DeviceType':     RotatorMetadata.DeviceType,
-                'DeviceNumber':   0,
-                'UniqueID':       RotatorMetadata.DeviceID
+                'DeviceNumber':   devnum,
+                'UniqueID':       rotatorcontroller.device_unique_id(devnum)
             }
+            for devnum in range(rotatorcontroller.maxdev + 1)
         ]
-        resp.text = PropertyResponse(confarray, req).json
+        resp.data = PropertyResponse(confarray, req).data
+
+class profile:
+    """
+    按需性能采集（见 profiling.py）
+    GET 返回当前状态；PUT Requests=N 和/或 Seconds=T 开始采集，Memory=true 同时记录内存分配
+    """
+    def on_get(self, req: Request, resp: Response):
+        resp.data = PropertyResponse(profiling.status(), req).data
+
+    def on_put(self, req: Request, resp: Response):
+        req_str = get_request_field('Requests', req, default='0')
+        sec_str = get_request_field('Seconds', req, default='0')
+        try:
+            max_requests = int(req_str)
+            seconds = float(sec_str)
+        except ValueError:
+            resp.data = MethodResponse(req, InvalidValueException(
+                f'Invalid Requests={req_str} / Seconds={sec_str}')).data
+            return
+        memory = to_bool(get_request_field('Memory', req, default='false'))
+
+        try:
+            profiling.start(max_requests, seconds, memory)
+            resp.data = MethodResponse(req).data
+        except ValueError as ex:
+            resp.data = MethodResponse(req, InvalidValueException(str(ex))).data
+        except RuntimeError as ex:
+            resp.data = MethodResponse(req, InvalidOperationException(str(ex))).data
+
+class clients:
+    """
+    按 ClientID / 来源地址的请求统计和限速状态（见 admission.py）
+    """
+    def on_get(self, req: Request, resp: Response):
+        resp.data = PropertyResponse(admission.status(), req).data
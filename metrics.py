@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# metrics.py - Prometheus-style metrics for the driver
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 进程内计数器和直方图，通过 GET /metrics 以 Prometheus 文本格式导出：
+#   alpaca_requests_total              按路由 / 方法 / HTTP 状态计数
+#   alpaca_request_errors_total        按路由 / Alpaca ErrorNumber 计数
+#   alpaca_request_duration_seconds    按路由的请求耗时直方图
+#   alpaca_device_lock_wait_seconds    RotatorDevice 命令等待设备锁的时间
+#   alpaca_motion_step_jitter_seconds  步进回调相对计划截止时间的延迟
+#   alpaca_admission_wait_seconds      按优先级排队等待执行名额的时间（[limits] active_requests）
+#   alpaca_requests_rejected_total     GET 轮询超过 [limits] 限速被拒绝的次数
+# 由 config.toml 的 [server] metrics 开关控制，关闭时以上都不记录。
+#
+import re
+import time
+import bisect
+from threading import Lock
+
+from falcon import Request, Response
+
+import driverlog
+from config import Config
+
+enabled: bool = Config.metrics
+
+# 秒；覆盖从几十微秒的缓存命中到秒级的长轮询
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+WAIT_BUCKETS = (0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+class Histogram:
+    """
+    固定桶的直方图；counts[i] 是落在 (buckets[i-1], buckets[i]] 的次数，最后一个是 +Inf
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def _lines(self, name: str, labels: str) -> list:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        sep = ',' if labels else ''
+        out, cum = [], 0
+        for le, n in zip(self.buckets, counts):
+            cum += n
+            out.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cum}')
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+        braces = f'{{{labels}}}' if labels else ''
+        out.append(f'{name}_sum{braces} {total}')
+        out.append(f'{name}_count{braces} {count}')
+        return out
+
+lock_wait = Histogram(WAIT_BUCKETS)
+step_jitter = Histogram(LATENCY_BUCKETS)
+queue_wait = {'command': Histogram(WAIT_BUCKETS), 'poll': Histogram(WAIT_BUCKETS)}
+
+class TimedLock:
+    """
+    包装 threading.Lock，记录每次获取锁的等待时间。
+    未被占用时只多一次非阻塞 acquire，不读时钟。
+    """
+
+    def __init__(self, lock, histogram: Histogram):
+        self._lock = lock
+        self._hist = histogram
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._hist.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        t0 = time.perf_counter()
+        ok = self._lock.acquire(True, timeout)
+        if ok:
+            self._hist.observe(time.perf_counter() - t0)
+        return ok
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self._lock.release()
+
+def timed_lock(lock):
+    """
+    启用 metrics 时返回记录等待时间的包装，否则原样返回
+    """
+    return TimedLock(lock, lock_wait) if enabled else lock
+
+# ------------------------------------------------------------------
+# 请求统计
+# ------------------------------------------------------------------
+_lock = Lock()
+_requests = {}          # (route, method, status) -> count
+_errors = {}            # (route, ErrorNumber) -> count
+_latency = {}           # route -> Histogram
+_route_names = {}       # uri_template -> route 标签
+_rejected = {}          # 限速原因 -> count
+
+def count_rejected(reason: str):
+    with _lock:
+        _rejected[reason] = _rejected.get(reason, 0) + 1
+
+_VERSION_SEG = re.compile(r'^v\d+$')
+
+def route_name(uri_template: str) -> str:
+    """
+    '/api/v1/rotator/{devnum:int(min=0)}/position' -> 'rotator/position'
+    '/management/v1/description' -> 'management/description'
+    """
+    if uri_template is None:
+        return 'unmatched'
+    name = _route_names.get(uri_template)
+    if name is None:
+        segs = [s for s in uri_template.strip('/').split('/')
+                if s and s != 'api' and not s.startswith('{') and not _VERSION_SEG.match(s)]
+        name = '/'.join(segs) or '/'
+        _route_names[uri_template] = name
+    return name
+
+class MetricsMiddleware:
+    """
+    Falcon middleware：记录每个请求的路由、状态、Alpaca ErrorNumber 和耗时。
+    同时提供 *_async 版本，WSGI 和 ASGI app 都可以直接使用。
+    ErrorNumber 由 common 中的响应类写入 req.context.error_number。
+    """
+
+    def process_request(self, req: Request, resp: Response):
+        req.context.t_start = time.perf_counter()
+
+    def process_response(self, req: Request, resp: Response, resource, req_succeeded: bool):
+        t_start = getattr(req.context, 't_start', None)
+        if t_start is None:
+            return
+        elapsed = time.perf_counter() - t_start
+        route = route_name(req.uri_template)
+        key = (route, req.method, resp.status_code)
+        errnum = getattr(req.context, 'error_number', 0)
+        with _lock:
+            _requests[key] = _requests.get(key, 0) + 1
+            if errnum:
+                ekey = (route, errnum)
+                _errors[ekey] = _errors.get(ekey, 0) + 1
+            hist = _latency.get(route)
+            if hist is None:
+                hist = _latency[route] = Histogram()
+        hist.observe(elapsed)
+
+    async def process_request_async(self, req: Request, resp: Response):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req: Request, resp: Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
+
+def render() -> str:
+    """
+    Prometheus 文本格式（version 0.0.4）
+    """
+    with _lock:
+        requests = sorted(_requests.items())
+        errors = sorted(_errors.items())
+        latency = sorted(_latency.items())
+        rejected = sorted(_rejected.items())
+
+    lines = ['# HELP alpaca_requests_total HTTP requests by route, method and status.',
+             '# TYPE alpaca_requests_total counter']
+    for (route, method, status), n in requests:
+        lines.append(f'alpaca_requests_total{{route="{route}",method="{method}",status="{status}"}} {n}')
+
+    lines += ['# HELP alpaca_request_errors_total Alpaca error responses by route and ErrorNumber.',
+              '# TYPE alpaca_request_errors_total counter']
+    for (route, errnum), n in errors:
+        lines.append(f'alpaca_request_errors_total{{route="{route}",error_number="{errnum}"}} {n}')
+
+    lines += ['# HELP alpaca_request_duration_seconds Request handling time by route.',
+              '# TYPE alpaca_request_duration_seconds histogram']
+    for route, hist in latency:
+        lines += hist._lines('alpaca_request_duration_seconds', f'route="{route}"')
+
+    lines += ['# HELP alpaca_device_lock_wait_seconds Time spent waiting for a RotatorDevice lock.',
+              '# TYPE alpaca_device_lock_wait_seconds histogram']
+    lines += lock_wait._lines('alpaca_device_lock_wait_seconds', '')
+
+    lines += ['# HELP alpaca_motion_step_jitter_seconds Motion step callback delay past its deadline.',
+              '# TYPE alpaca_motion_step_jitter_seconds histogram']
+    lines += step_jitter._lines('alpaca_motion_step_jitter_seconds', '')
+
+    lines += ['# HELP alpaca_admission_wait_seconds Time a request waited for an execution slot, by priority.',
+              '# TYPE alpaca_admission_wait_seconds histogram']
+    for priority, hist in queue_wait.items():
+        lines += hist._lines('alpaca_admission_wait_seconds', f'priority="{priority}"')
+
+    lines += ['# HELP alpaca_requests_rejected_total GET polls rejected by the [limits] rate limits.',
+              '# TYPE alpaca_requests_rejected_total counter']
+    for reason, n in rejected:
+        lines.append(f'alpaca_requests_rejected_total{{limit="{reason}"}} {n}')
+
+    stats = driverlog.queue_stats()
+    if stats is not None:
+        lines += ['# HELP alpaca_log_records_dropped_total Log records dropped because the async log queue was full.',
+                  '# TYPE alpaca_log_records_dropped_total counter',
+                  f'alpaca_log_records_dropped_total {stats["dropped"]}',
+                  '# HELP alpaca_log_queue_pending Log records waiting to be written.',
+                  '# TYPE alpaca_log_queue_pending gauge',
+                  f'alpaca_log_queue_pending {stats["pending"]}']
+    return '\n'.join(lines) + '\n'
+
+class metrics:
+    """
+    GET /metrics
+    """
+
+    def on_get(self, req: Request, resp: Response):
+        resp.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        resp.data = render().encode()
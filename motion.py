@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# motion.py - Shared motion scheduler for simulated devices
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 用一个常驻线程按截止时间（time.monotonic）驱动所有设备的步进，
+# 代替每一步新建一个 threading.Timer。
+#
+import heapq
+import itertools
+import time
+from threading import Thread, Condition
+from logging import Logger
+
+logger: Logger = None
+
+class MotionScheduler:
+    """
+    最小堆保存 (deadline, seq, callback, args)，线程睡到最早的截止时间再执行回调。
+    回调在调度器自己的锁之外执行，可以在回调里再次调用 call_at。
+    """
+
+    def __init__(self):
+        self._cond = Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+
+    def call_at(self, deadline: float, callback, *args):
+        """
+        在 time.monotonic() 到达 deadline 时调用 callback(*args)
+        """
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, next(self._seq), callback, args))
+            if self._thread is None:
+                self._thread = Thread(target=self._loop, name='MotionScheduler', daemon=True)
+                self._thread.start()
+            # 唤醒线程按新的堆顶重新计算睡眠时间
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                _, _, callback, args = heapq.heappop(self._heap)
+            try:
+                callback(*args)
+            except Exception as ex:
+                if logger is not None:
+                    logger.error(f'MotionScheduler: {type(ex).__name__} in {callback}: {ex}')
+
+# 全局单例，所有设备共用（线程在第一次 call_at 时才启动）
+scheduler = MotionScheduler()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# multiproc.py - Multi-process scale-out with shared device state
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# [network] processes > 1 时：
+#   主进程（owner）持有真正的 RotatorDevice、运动调度、发现应答、配置监视和日志文件，
+#       每次设备发布快照时把它写进一块共享内存（每台设备一个槽，seqlock 保护）；
+#   N 个 worker 进程（spawn 启动）各自用 SO_REUSEPORT 监听同一个端口，由内核分摊连接。
+#       GET 直接从共享内存读快照，不经过主进程；PUT 命令通过 Pipe 交给主进程执行并等待结果。
+#   ServerTransactionID 按 worker 编号交错分配（i+1, i+1+N, ...），各进程互不重复；
+#       重启的 worker 从共享内存里记录的该槽位最大 ID 接着分配。
+#   worker 的日志经 multiprocessing.Queue 交给主进程写入同一个日志文件；
+#   worker 异常退出时主进程记录错误并重新拉起。
+# /metrics 与性能采集只反映处理该请求的 worker 进程。仅支持 POSIX（需要 SO_REUSEPORT）。
+#
+import os
+import time
+import struct
+import multiprocessing
+from threading import Thread, Lock
+from logging import Logger
+
+import common
+import driverlog
+import trajectory
+import configwatcher
+import rotatorcontroller
+from config import Config
+from discovery import DiscoveryResponder
+from rotatordevice import RotatorDevice, RotatorState, _Move, project_state
+
+logger: Logger = None
+
+# ------------------------------------------------------------------
+# 共享内存布局：每台设备一个 192 字节的槽
+#   seq(Q) version(Q) | 13 个 double | 排队的 move 数(I) | 速度曲线(B) | 7 个 bool
+# 加减速曲线的采样表不放进共享内存，worker 看到新的运动时按其参数自己生成一次
+# seq 为奇数表示正在写；读方读到相同的偶数 seq 前后两次才算读到一致的数据
+# ------------------------------------------------------------------
+_HDR = struct.Struct('<QQ')
+_BODY = struct.Struct('<13dIB7?')
+_SEQ = struct.Struct('<Q')
+SLOT_SIZE = 192
+
+_ctx = multiprocessing.get_context('spawn')
+
+def create_shared(num_devices: int):
+    """
+    分配共享内存（RawArray 可以作为 spawn 子进程的参数传递）
+    """
+    return _ctx.RawArray('B', SLOT_SIZE * num_devices)
+
+class SharedStateWriter:
+    """
+    owner 进程：作为 RotatorDevice 的 listener，在设备锁内把最新发布写入共享内存
+    """
+
+    def __init__(self, shared, index: int, dev: RotatorDevice):
+        self._buf = memoryview(shared).cast('B')
+        self._off = index * SLOT_SIZE
+        self._dev = dev
+        dev.add_listener(self.publish)
+        with dev._lock:
+            self.publish()
+
+    def publish(self):
+        dev = self._dev
+        state, move = dev.published
+        buf, off = self._buf, self._off
+        seq = _SEQ.unpack_from(buf, off)[0]
+        # seq 为奇数期间写 version 和 body，最后单独写回偶数 seq：读方看到的偶数 seq
+        # 一定对应完整的 version + body
+        _HDR.pack_into(buf, off, seq + 1, dev.version)
+        m = move if move is not None else _Move(0.0, 0.0, 0.0, 0.0, 0.0)
+        _BODY.pack_into(buf, off + _HDR.size,
+                        state.position, state.mechanical_position, state.target_position, state.offset,
+                        dev.step_size, dev.steps_per_sec, dev.step_interval,
+                        m.t0, m.start, m.delta, m.rate, m.duration, m.accel,
+                        state.queued, trajectory.PROFILES.index(m.profile),
+                        state.is_moving, state.connected, state.reverse,
+                        dev.can_reverse, dev._analytic, move is not None, m.chained)
+        _SEQ.pack_into(buf, off, seq + 2)
+
+class _Channel:
+    """
+    worker 进程到 owner 的命令通道；同一进程的多个请求线程串行使用
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = Lock()
+
+    def call(self, devnum: int, op: str, *args):
+        with self._lock:
+            self._conn.send((devnum, op, args))
+            ok, msg = self._conn.recv()
+        if not ok:
+            raise RuntimeError(msg)
+
+class SharedRotator:
+    """
+    worker 进程里 RotatorDevice 的替身：读操作走共享内存，命令转发给 owner。
+    接口与 rotatorcontroller 用到的 RotatorDevice 方法/属性一致。
+    """
+    _POLL = 0.005  # 等待状态变化时轮询共享内存的间隔（秒）
+
+    def __init__(self, shared, index: int, channel: _Channel):
+        self._buf = memoryview(shared).cast('B')
+        self._off = index * SLOT_SIZE
+        self._index = index
+        self._channel = channel
+        self._cache = (None, None, None, None)      # (seq, version, state, move)
+        self._body = None
+        self._path = None           # (运动参数, Trajectory)
+        self._listeners = ()
+        self._watcher = None
+        self._listener_lock = Lock()
+
+    def _read(self):
+        """
+        返回 (version, state, move)，seq 未变时直接复用上次解析的结果
+        """
+        buf, off = self._buf, self._off
+        while True:
+            seq, version = _HDR.unpack_from(buf, off)
+            if seq == self._cache[0]:
+                return self._cache[1:]
+            if seq & 1:
+                continue
+            body = _BODY.unpack_from(buf, off + _HDR.size)
+            if _SEQ.unpack_from(buf, off)[0] != seq:
+                continue
+            break
+        (pos, mech, tgt, offset, _, _, _, t0, start, delta, rate, duration, accel,
+         queued, profile, moving, connected, reverse, _, _, has_move, chained) = body
+        state = RotatorState(position=pos, mechanical_position=mech, target_position=tgt,
+                             is_moving=moving, connected=connected, reverse=reverse, offset=offset,
+                             queued=queued)
+        move = None
+        if has_move:
+            move = _Move(t0, start, delta, rate, duration, chained, trajectory.PROFILES[profile], accel)
+            if move.profile != 'constant':
+                move = move._replace(path=self._path_for(move))
+        self._body = body
+        self._cache = (seq, version, state, move)
+        return version, state, move
+
+    def _path_for(self, move: _Move):
+        """
+        同一次运动只生成一次采样表；版本号因为其他原因（连接、排队等）变化时沿用上一张
+        """
+        key = move[:4] + move[6:8]     # t0, start, delta, rate, profile, accel
+        if self._path is None or self._path[0] != key:
+            self._path = (key, trajectory.build(move.profile, abs(move.delta), move.rate, move.accel))
+        return self._path[1]
+
+    # ---- 读操作 ----
+    @property
+    def snapshot(self) -> RotatorState:
+        _, state, move = self._read()
+        return project_state(state, move)
+
+    @property
+    def version(self) -> int:
+        return self._read()[0]
+
+    def _field(self, i: int):
+        self._read()
+        return self._body[i]
+
+    @property
+    def step_size(self) -> float:
+        return self._field(4)
+
+    @property
+    def steps_per_sec(self) -> float:
+        return self._field(5)
+
+    @property
+    def step_interval(self) -> float:
+        return self._field(6)
+
+    @property
+    def can_reverse(self) -> bool:
+        return self._field(18)
+
+    @property
+    def _analytic(self) -> bool:
+        return self._field(19)
+
+    @property
+    def position(self) -> float:
+        return self.snapshot.position
+
+    @property
+    def is_moving(self) -> bool:
+        return self.snapshot.is_moving
+
+    @property
+    def connected(self) -> bool:
+        return self.snapshot.connected
+
+    @connected.setter
+    def connected(self, value: bool):
+        self._channel.call(self._index, 'connected', value)
+
+    @property
+    def reverse(self) -> bool:
+        return self.snapshot.reverse
+
+    @reverse.setter
+    def reverse(self, value: bool):
+        self._channel.call(self._index, 'reverse', value)
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        跨进程没有 Condition 可等，按 _POLL 间隔检查共享内存里的序号
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.version
+            remaining = deadline - time.monotonic()
+            if current != version or remaining <= 0:
+                return current
+            time.sleep(min(self._POLL, remaining))
+
+    wait_for_motion = RotatorDevice.wait_for_motion
+
+    def add_listener(self, callback):
+        with self._listener_lock:
+            self._listeners = self._listeners + (callback,)
+            if self._watcher is None:
+                self._watcher = Thread(target=self._watch, name=f'SharedRotator-{self._index}', daemon=True)
+                self._watcher.start()
+
+    def remove_listener(self, callback):
+        with self._listener_lock:
+            self._listeners = tuple(cb for cb in self._listeners if cb is not callback)
+
+    def _watch(self):
+        # 有订阅者时轮询共享内存，序号变化就回调；订阅者全部离开后线程退出
+        version = self.version
+        while True:
+            version = self.wait_for_change(version, 1.0)
+            with self._listener_lock:
+                listeners = self._listeners
+                if not listeners:
+                    self._watcher = None
+                    return
+            for listener in listeners:
+                listener()
+
+    # ---- 命令，由 owner 进程执行 ----
+    def Move(self, delta_pos: float):
+        self._channel.call(self._index, 'Move', delta_pos)
+
+    def MoveAbsolute(self, pos: float):
+        self._channel.call(self._index, 'MoveAbsolute', pos)
+
+    def MoveMechanical(self, pos: float):
+        self._channel.call(self._index, 'MoveMechanical', pos)
+
+    def Sync(self, pos: float):
+        self._channel.call(self._index, 'Sync', pos)
+
+    def Halt(self):
+        self._channel.call(self._index, 'Halt')
+
+    def configure(self, step_size: float, steps_per_sec: float, can_reverse: bool, move_queue: int = 0,
+                  acceleration: float = 0.0):
+        # 设备配置由 owner 进程的配置监视负责，新值经共享内存反映过来
+        pass
+
+def attach_worker(index: int, count: int, shared, tids, conn):
+    """
+    worker 进程：用 SharedRotator 代替设备，并按编号交错分配 ServerTransactionID，
+    从 tids[index]（本槽位此前的进程已发出的最大 ID）接着分配
+    """
+    channel = _Channel(conn)
+    rotatorcontroller.attach_rot_devices(logger, [SharedRotator(shared, i, channel)
+                                                  for i in range(len(shared) // SLOT_SIZE)])
+    common.set_trans_id_stride(index, count, tids)
+
+# ------------------------------------------------------------------
+# owner 进程
+# ------------------------------------------------------------------
+_COMMANDS = ('Move', 'MoveAbsolute', 'MoveMechanical', 'Sync', 'Halt')
+_SETTERS = ('connected', 'reverse')
+
+def _serve_commands(conn, devs: list, name: str):
+    while True:
+        try:
+            devnum, op, args = conn.recv()
+        except (EOFError, OSError):
+            return  # worker 已退出
+        try:
+            dev = devs[devnum]
+            if op in _SETTERS:
+                setattr(dev, op, *args)
+            elif op in _COMMANDS:
+                getattr(dev, op)(*args)
+            else:
+                raise ValueError(f'Unknown command {op}')
+            reply = (True, None)
+        except Exception as ex:
+            reply = (False, str(ex))
+        try:
+            conn.send(reply)
+        except (BrokenPipeError, OSError):
+            logger.warning('%s went away before the %s reply was sent', name, op)
+            return
+
+def _start_worker(index: int, count: int, target, shared, tids, log_queue, devs: list):
+    parent_conn, child_conn = _ctx.Pipe()
+    name = f'worker-{index}'
+    proc = _ctx.Process(target=target, args=(index, count, shared, tids, child_conn, log_queue),
+                        name=name, daemon=True)
+    proc.start()
+    child_conn.close()
+    Thread(target=_serve_commands, args=(parent_conn, devs, name), name=f'{name}-cmd', daemon=True).start()
+    return proc
+
+def run_owner(worker_target):
+    """
+    主进程：创建设备和共享内存，启动 worker，之后只负责监视 worker（不返回）。
+    worker_target(index, count, shared, tids, conn, log_queue) 是 worker 进程的入口
+    """
+    if os.name == 'nt':
+        raise RuntimeError('[network] processes > 1 requires SO_REUSEPORT (POSIX only)')
+
+    rotatorcontroller.start_rot_device(logger)
+    devs = rotatorcontroller.rot_devs
+    shared = create_shared(len(devs))
+    for i, dev in enumerate(devs):
+        SharedStateWriter(shared, i, dev)
+
+    log_queue = _ctx.Queue(Config.log_queue_size)
+    driverlog.listen_worker_logs(log_queue)
+    # 每个进程各自监视 config.toml：设备参数由这里应用，日志级别/策略等由各 worker 自己应用
+    configwatcher.start_watcher()
+    _DSC = DiscoveryResponder(Config.ip_address, Config.port)
+
+    count = Config.processes
+    tids = _ctx.RawArray('Q', count)    # 各 worker 槽位已发出的最大 ServerTransactionID，跨重启保留
+    procs = [_start_worker(i, count, worker_target, shared, tids, log_queue, devs) for i in range(count)]
+    logger.info('==STARTUP== Started %d worker processes on port %d', count, Config.port)
+
+    while True:
+        multiprocessing.connection.wait([p.sentinel for p in procs])
+        for i, proc in enumerate(procs):
+            if proc.exitcode is None:
+                continue
+            logger.error('%s exited with code %s, restarting', proc.name, proc.exitcode)
+            time.sleep(1.0)  # 避免启动即崩溃时疯狂重启
+            procs[i] = _start_worker(i, count, worker_target, shared, tids, log_queue, devs)
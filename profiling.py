@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# profiling.py - On-demand request profiling
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 通过 PUT /management/v1/profile 开启一次采集：接下来的 N 个请求或 T 秒内，
+# 每个请求在自己的线程里用 cProfile 记录（包括 Falcon 路由、钩子、序列化、日志和锁等待），
+# 结束时合并成一份统计写到当前目录（与 my_alpaca.log 相同）。
+# 同一时刻只有一个请求在 cProfile 下执行：Python 3.12 起进程内不能同时启用多个 profiler，
+# 与之重叠的请求照常处理但不采集，计入 Skipped（另有调试器等工具占用 profiler 时同样跳过）：
+#   profile-<UTC时间>.prof            pstats 二进制，可用 snakeviz 等工具查看
+#   profile-<UTC时间>.txt             按 cumulative 排序的前若干行
+#   profile-<UTC时间>.tracemalloc.txt 请求期间新分配内存的前若干行（Memory=true 时）
+# 未开启时中间件只做一次全局变量判断。
+# ASGI 模式下只记录线程池里执行的 responder（含 @before 钩子），不含事件循环一侧的路由。
+#
+import os
+import time
+from threading import Lock
+from logging import Logger
+
+from falcon import Request, Response
+
+logger: Logger = None
+
+TOP_LINES = 40
+
+# cProfile / pstats / tracemalloc 只在第一次开启采集时才导入，不拖慢启动
+cProfile = pstats = tracemalloc = None
+
+def _import_profilers():
+    global cProfile, pstats, tracemalloc
+    import cProfile, pstats, tracemalloc
+
+def _mem_filters() -> list:
+    return [tracemalloc.Filter(False, mod.__file__) for mod in (cProfile, pstats, tracemalloc)] + \
+           [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, '*/linecache.py')]
+
+class _Session:
+    def __init__(self, max_requests: int, seconds: float, memory: bool):
+        self.max_requests = max_requests
+        self.deadline = time.monotonic() + seconds if seconds > 0 else None
+        self.memory = memory
+        self.requests = 0
+        self.skipped = 0                    # 因为另一个请求正在采集而没有采集的请求
+        self.stats = None                   # pstats.Stats
+        self.started = time.gmtime()
+        if memory:
+            tracemalloc.start()
+            self.mem_start = tracemalloc.take_snapshot()
+
+    def expired(self, now: float) -> bool:
+        if self.max_requests > 0 and self.requests >= self.max_requests:
+            return True
+        return self.deadline is not None and now >= self.deadline
+
+_lock = Lock()
+_profiling = Lock()     # 持有者是当前唯一在 cProfile 下执行的请求
+_session: _Session = None
+last_output: str = None
+
+def start(max_requests: int = 0, seconds: float = 0.0, memory: bool = False):
+    """
+    开始一次采集；max_requests 和 seconds 至少给一个，先到者结束
+    """
+    global _session
+    if max_requests <= 0 and seconds <= 0:
+        raise ValueError('Requests or Seconds must be positive')
+    _import_profilers()
+    with _lock:
+        if _session is not None:
+            raise RuntimeError('Profiling is already active')
+        _session = _Session(max_requests, seconds, memory)
+    logger.info('[profile] started: requests=%s seconds=%s memory=%s', max_requests, seconds, memory)
+
+def status() -> dict:
+    """
+    当前采集状态；超时的采集在这里也会结束并写出文件
+    """
+    _finish_if_expired()
+    s = _session
+    if s is None:
+        return {'Active': False, 'LastOutput': last_output}
+    remaining = None if s.deadline is None else max(0.0, round(s.deadline - time.monotonic(), 1))
+    return {'Active': True, 'Requests': s.requests, 'Skipped': s.skipped, 'MaxRequests': s.max_requests,
+            'SecondsRemaining': remaining, 'Memory': s.memory, 'LastOutput': last_output}
+
+def _finish_if_expired():
+    global _session
+    with _lock:
+        s = _session
+        if s is None or not s.expired(time.monotonic()):
+            return
+        _session = None
+    _dump(s)
+
+def _dump(s: _Session):
+    global last_output
+    base = time.strftime('profile-%Y%m%dT%H%M%S', s.started)
+    if s.stats is not None:
+        s.stats.dump_stats(f'{base}.prof')
+        with open(f'{base}.txt', 'w', encoding='utf-8') as f:
+            s.stats.stream = f
+            f.write(f'{s.requests} requests\n')
+            s.stats.sort_stats('cumulative').print_stats(TOP_LINES)
+    if s.memory:
+        # 去掉采集本身（cProfile/pstats 合并统计）的分配
+        snap = tracemalloc.take_snapshot().filter_traces(_mem_filters())
+        tracemalloc.stop()
+        with open(f'{base}.tracemalloc.txt', 'w', encoding='utf-8') as f:
+            for stat in snap.compare_to(s.mem_start.filter_traces(_mem_filters()), 'lineno')[:TOP_LINES]:
+                f.write(f'{stat}\n')
+    last_output = os.path.abspath(base)
+    logger.info('[profile] %s requests written to %s.*', s.requests, last_output)
+
+def _begin():
+    """
+    为当前请求启用 profiler 并返回；另一个请求正在采集、或 profiler 被别的工具占用时
+    返回 None，该请求不采集
+    """
+    if _profiling.acquire(blocking=False):
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+            return prof
+        except ValueError:      # Another profiling tool is already active
+            _profiling.release()
+    with _lock:
+        if _session is not None:
+            _session.skipped += 1
+    return None
+
+def _end(prof):
+    prof.disable()
+    _profiling.release()
+    _collect(prof)
+
+def _collect(prof):
+    """
+    把一个请求的 profile 合并进当前采集
+    """
+    with _lock:
+        s = _session
+        if s is None:
+            return
+        if s.stats is None:
+            s.stats = pstats.Stats(prof)
+        else:
+            s.stats.add(prof)
+        s.requests += 1
+    _finish_if_expired()
+
+def profile_call(fn):
+    """
+    采集期间在 cProfile 下执行 fn()，否则直接执行。ASGI 适配层用它包装线程池里的 responder
+    """
+    if _session is None:
+        return fn()
+    prof = _begin()
+    if prof is None:
+        return fn()
+    try:
+        return fn()
+    finally:
+        _end(prof)
+
+class ProfilingMiddleware:
+    """
+    WSGI 模式下，采集期间为请求开一个 cProfile.Profile（cProfile 只记录所在线程），
+    请求结束后合并进本次采集的 pstats.Stats。应放在中间件列表的最前面。
+    ASGI 模式下多个请求共用事件循环线程，改由 httpserver 用 profile_call 包装 responder，
+    这里的 async 版本什么也不做。
+    """
+
+    def process_request(self, req: Request, resp: Response):
+        if _session is None:
+            return
+        req.context.profiler = _begin()
+
+    def process_response(self, req: Request, resp: Response, resource, req_succeeded: bool):
+        prof = getattr(req.context, 'profiler', None)
+        if prof is None:
+            return
+        _end(prof)
+
+    async def process_request_async(self, req: Request, resp: Response):
+        pass
+
+    async def process_response_async(self, req: Request, resp: Response, resource, req_succeeded: bool):
+        pass
@@ -6,18 +6,27 @@
 #
 # MIT License
 # -----------------------------------------------------------------------------
+import uuid
+import json
+import time
+import asyncio
 import falcon
+import falcon.asgi
+from operator import attrgetter
+from threading import Lock
 from falcon import Request, Response, HTTPBadRequest, before
 from logging import Logger
 
+import admission
 from common import PropertyResponse, MethodResponse, PreProcessRequest, \
                    get_request_field, to_bool
+from config import Config
 from exceptions import *
 from rotatordevice import RotatorDevice
 
 logger: Logger = None
 
-maxdev = 0  # 单设备示例，如果要支持多实例，可以增大这个值
+maxdev = Config.num_devices - 1  # 设备编号 0..maxdev，由 config.toml [device] num_devices 决定
 
 class RotatorMetadata:
     """
@@ -31,206 +40,484 @@ class RotatorMetadata:
     DeviceManufacturer = 'ASCOM Initiative'
     InterfaceVersion = 3
 
-# 单例模拟的设备实例
-rot_dev = None
+# 模拟的设备实例，下标即 devnum；每个实例有自己的锁和运动状态
+rot_devs: list = []
+
+# [device] motion_model -> (是否解析模型, 速度曲线)；启动时 config.validate 已保证取值合法
+_MOTION_MODELS = {
+    'stepped':   (False, 'constant'),
+    'analytic':  (True, 'constant'),
+    'trapezoid': (True, 'trapezoid'),
+    'scurve':    (True, 'scurve'),
+}
 
 def start_rot_device(log: Logger):
     """
-    在 main.py 中被调用，用来初始化模拟器
+    在 main.py 中被调用，用来初始化模拟器（num_devices 个实例）
+    """
+    global logger, rot_devs
+    logger = log
+    analytic, profile = _MOTION_MODELS[Config.motion_model]
+    rot_devs = [RotatorDevice(logger, analytic=analytic,
+                              step_size=Config.step_size, steps_per_sec=Config.steps_per_sec,
+                              can_reverse=Config.can_reverse, move_queue=Config.move_queue,
+                              profile=profile, acceleration=Config.acceleration)
+                for _ in range(maxdev + 1)]
+
+def attach_rot_devices(log: Logger, devs: list):
+    """
+    多进程模式的 worker 里使用：设备由主进程持有，这里挂上接口相同的替身（multiproc.SharedRotator）
     """
-    global logger, rot_dev
+    global logger, rot_devs
     logger = log
-    rot_dev = RotatorDevice(logger)
+    rot_devs = devs
+
+def configure_devices():
+    """
+    配置热加载后，把 [device] 中可在线修改的参数应用到所有设备
+    """
+    for dev in rot_devs:
+        dev.configure(Config.step_size, Config.steps_per_sec, Config.can_reverse, Config.move_queue,
+                      Config.acceleration)
+
+def device_unique_id(devnum: int) -> str:
+    """
+    0 号设备沿用 RotatorMetadata.DeviceID，其余设备由它派生出稳定的 UUID
+    """
+    if devnum == 0:
+        return RotatorMetadata.DeviceID
+    return str(uuid.uuid5(uuid.UUID(RotatorMetadata.DeviceID), str(devnum))).upper()
+
+# 静态属性的预序列化响应，每次请求只填入事务 ID
+_description_resp = PropertyResponse.template(RotatorMetadata.Description)
+_driverinfo_resp = PropertyResponse.template(f'{RotatorMetadata.Name} by {RotatorMetadata.DeviceManufacturer}')
+_interfaceversion_resp = PropertyResponse.template(RotatorMetadata.InterfaceVersion)
+_driverversion_resp = PropertyResponse.template(RotatorMetadata.Version)
+_name_resp = PropertyResponse.template(RotatorMetadata.Name)
+_supportedactions_resp = PropertyResponse.template([])
+# CanReverse 来自配置，两种取值各预先序列化一份
+_canreverse_resp = {True: PropertyResponse.template(True), False: PropertyResponse.template(False)}
+
+# ------------------------------------------------------------------
+# 读合并：[device] read_coalesce > 0 时，同一设备同一属性的 GET 在 TTL 内共用一个
+# 预序列化的 ResponseTemplate（每次请求只填事务 ID），TTL = read_coalesce × 步进间隔。
+# 条目记下生成时的设备状态版本号，move / sync / halt / connected 等 PUT 发布新状态后
+# 版本号改变，条目立即失效（多进程模式下其他 worker 的 PUT 同样可见）。
+# 未命中时同一个键只有一个线程去读快照并序列化，并发的相同请求等它的结果。
+# 解析模型运动中位置随时间连续变化且不发布新状态，读到的值最多旧 TTL 秒。
+# 过期的条目（连同它的锁）每隔 _PRUNE_INTERVAL 秒清理一次。
+# ------------------------------------------------------------------
+class ReadCache:
+    _PRUNE_INTERVAL = 10.0
+
+    def __init__(self):
+        self._entries = {}      # (devnum, key) -> (version, expires, ResponseTemplate)
+        self._locks = {}        # (devnum, key) -> Lock，single-flight
+        self._prune_lock = Lock()
+        self._next_prune = 0.0
+
+    def _prune(self, now: float):
+        # 只有一个线程清理；被删掉的锁若仍有人持有，最多让下一次未命中多算一次
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_prune = now + self._PRUNE_INTERVAL
+            for ck, entry in list(self._entries.items()):
+                if entry[1] < now:
+                    self._entries.pop(ck, None)
+            # 未连接时只建了锁没有条目，一并清理
+            for ck in list(self._locks):
+                if ck not in self._entries:
+                    self._locks.pop(ck, None)
+        finally:
+            self._prune_lock.release()
+
+    def get(self, devnum: int, key, value_of):
+        """
+        返回当前值的 ResponseTemplate；设备未连接时返回 None。
+        value_of(state) 从快照取出属性值
+        """
+        dev = rot_devs[devnum]
+        ck = (devnum, key)
+        entry = self._entries.get(ck)
+        if entry is not None and entry[0] == dev.version and time.monotonic() < entry[1]:
+            return entry[2]
+
+        lock = self._locks.get(ck)
+        if lock is None:
+            lock = self._locks.setdefault(ck, Lock())
+        with lock:
+            # 先取版本号再取快照：两者之间若有新发布，条目的版本号偏旧，下次只会多算一次
+            version = dev.version
+            entry = self._entries.get(ck)
+            if entry is not None and entry[0] == version and time.monotonic() < entry[1]:
+                return entry[2]
+            st = dev.snapshot
+            if not st.connected:
+                return None
+            tmpl = PropertyResponse.template(value_of(st))
+            now = time.monotonic()
+            self._entries[ck] = (version, now + Config.read_coalesce * dev.step_interval, tmpl)
+        if now >= self._next_prune:
+            self._prune(now)
+        return tmpl
+
+_read_cache = ReadCache()
+
+def _read_property(req: Request, resp: Response, devnum: int, attr: str, what: str):
+    """
+    GET 快照属性的公共实现：同一个快照里判断连接状态并取值，不与运动线程争锁；
+    开启读合并时经过 _read_cache
+    """
+    try:
+        if Config.read_coalesce > 0:
+            tmpl = _read_cache.get(devnum, attr, attrgetter(attr))
+            if tmpl is None:
+                resp.data = PropertyResponse(None, req, NotConnectedException()).data
+            else:
+                resp.data = tmpl.render(req)
+            return
+        state = rot_devs[devnum].snapshot
+        if not state.connected:
+            resp.data = PropertyResponse(None, req, NotConnectedException()).data
+            return
+        resp.data = PropertyResponse(getattr(state, attr), req).data
+    except Exception as ex:
+        resp.data = PropertyResponse(None, req, DriverException(0x500, f'{what} failed', ex)).data
 
 # 以下是一系列 Falcon Resource 类（对应 Alpaca Rotator 的属性/方法）:
 
 @before(PreProcessRequest(maxdev))
 class action:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        resp.text = MethodResponse(req, NotImplementedException()).json
+        resp.data = MethodResponse(req, NotImplementedException()).data
 
 @before(PreProcessRequest(maxdev))
 class commandblind:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        resp.text = MethodResponse(req, NotImplementedException()).json
+        resp.data = MethodResponse(req, NotImplementedException()).data
 
 @before(PreProcessRequest(maxdev))
 class commandbool:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        resp.text = MethodResponse(req, NotImplementedException()).json
+        resp.data = MethodResponse(req, NotImplementedException()).data
 
 @before(PreProcessRequest(maxdev))
 class commandstring:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        resp.text = MethodResponse(req, NotImplementedException()).json
+        resp.data = MethodResponse(req, NotImplementedException()).data
 
 @before(PreProcessRequest(maxdev))
 class description:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse(RotatorMetadata.Description, req).json
+        resp.data = _description_resp.render(req)
 
 @before(PreProcessRequest(maxdev))
 class driverinfo:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        info = f'{RotatorMetadata.Name} by {RotatorMetadata.DeviceManufacturer}'
-        resp.text = PropertyResponse(info, req).json
+        resp.data = _driverinfo_resp.render(req)
 
 @before(PreProcessRequest(maxdev))
 class interfaceversion:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse(RotatorMetadata.InterfaceVersion, req).json
+        resp.data = _interfaceversion_resp.render(req)
 
 @before(PreProcessRequest(maxdev))
 class driverversion:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse(RotatorMetadata.Version, req).json
+        resp.data = _driverversion_resp.render(req)
 
 @before(PreProcessRequest(maxdev))
 class name:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse(RotatorMetadata.Name, req).json
+        resp.data = _name_resp.render(req)
 
 @before(PreProcessRequest(maxdev))
 class supportedactions:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse([], req).json
+        resp.data = _supportedactions_resp.render(req)
 
 @before(PreProcessRequest(maxdev))
 class canreverse:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        # 在原示例中，始终返回 True
-        resp.text = PropertyResponse(True, req).json
+        resp.data = _canreverse_resp[rot_devs[devnum].can_reverse].render(req)
 
 @before(PreProcessRequest(maxdev))
 class connected:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse(rot_dev.connected, req).json
+        resp.data = PropertyResponse(rot_devs[devnum].snapshot.connected, req).data
 
     def on_put(self, req: Request, resp: Response, devnum: int):
+        dev = rot_devs[devnum]
         conn_str = get_request_field('Connected', req)
         conn_val = to_bool(conn_str)
         try:
-            rot_dev.connected = conn_val
-            resp.text = MethodResponse(req).json
+            dev.connected = conn_val
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.Connected failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.Connected failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class ismoving:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = PropertyResponse(None, req, NotConnectedException()).json
-            return
-        try:
-            moving = rot_dev.is_moving
-            resp.text = PropertyResponse(moving, req).json
-        except Exception as ex:
-            resp.text = PropertyResponse(None, req,
-                                         DriverException(0x500, 'Rotator.IsMoving failed', ex)).json
+        _read_property(req, resp, devnum, 'is_moving', 'Rotator.IsMoving')
 
 @before(PreProcessRequest(maxdev))
 class mechanicalposition:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = PropertyResponse(None, req, NotConnectedException()).json
-            return
-        try:
-            pos = rot_dev.mechanical_position
-            resp.text = PropertyResponse(pos, req).json
-        except Exception as ex:
-            resp.text = PropertyResponse(None, req,
-                                         DriverException(0x500, 'Rotator.MechanicalPosition failed', ex)).json
+        _read_property(req, resp, devnum, 'mechanical_position', 'Rotator.MechanicalPosition')
 
 @before(PreProcessRequest(maxdev))
 class position:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = PropertyResponse(None, req, NotConnectedException()).json
-            return
-        try:
-            pos_val = rot_dev.position
-            resp.text = PropertyResponse(pos_val, req).json
-        except Exception as ex:
-            resp.text = PropertyResponse(None, req,
-                                         DriverException(0x500, 'Rotator.Position failed', ex)).json
+        _read_property(req, resp, devnum, 'position', 'Rotator.Position')
 
 @before(PreProcessRequest(maxdev))
 class reverse:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = PropertyResponse(None, req, NotConnectedException()).json
-            return
-        try:
-            rev = rot_dev.reverse
-            resp.text = PropertyResponse(rev, req).json
-        except Exception as ex:
-            resp.text = PropertyResponse(None, req,
-                                         DriverException(0x500, 'Rotator.Reverse failed', ex)).json
+        _read_property(req, resp, devnum, 'reverse', 'Rotator.Reverse')
 
     def on_put(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = MethodResponse(req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = MethodResponse(req, NotConnectedException()).data
             return
         rev_str = get_request_field('Reverse', req)
         rev_val = to_bool(rev_str)
+        if not dev.can_reverse:
+            resp.data = MethodResponse(req, NotImplementedException('Rotator.Reverse is not supported')).data
+            return
         try:
-            rot_dev.reverse = rev_val
-            resp.text = MethodResponse(req).json
+            dev.reverse = rev_val
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.Reverse failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.Reverse failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class stepsize:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = PropertyResponse(None, req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = PropertyResponse(None, req, NotConnectedException()).data
             return
         try:
-            st = rot_dev.step_size
-            resp.text = PropertyResponse(st, req).json
+            st = dev.step_size
+            resp.data = PropertyResponse(st, req).data
         except Exception as ex:
-            resp.text = PropertyResponse(None, req,
-                                         DriverException(0x500, 'Rotator.StepSize failed', ex)).json
+            resp.data = PropertyResponse(None, req,
+                                         DriverException(0x500, 'Rotator.StepSize failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class targetposition:
     def on_get(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = PropertyResponse(None, req, NotConnectedException()).json
+        _read_property(req, resp, devnum, 'target_position', 'Rotator.TargetPosition')
+
+# 非标准扩展：一次请求从同一个快照返回多个属性，减少客户端轮询次数
+# GET /api/v1/rotator/{devnum}/state[?Properties=Position,IsMoving]
+_state_fields = {
+    'position':           ('Position', 'position'),
+    'mechanicalposition': ('MechanicalPosition', 'mechanical_position'),
+    'targetposition':     ('TargetPosition', 'target_position'),
+    'ismoving':           ('IsMoving', 'is_moving'),
+    'reverse':            ('Reverse', 'reverse'),
+}
+
+def _state_value(st, names) -> dict:
+    return {_state_fields[n][0]: getattr(st, _state_fields[n][1]) for n in names}
+
+@before(PreProcessRequest(maxdev))
+class state:
+    def on_get(self, req: Request, resp: Response, devnum: int):
+        props = get_request_field('Properties', req, default='')
+        requested = {p.strip().lower() for p in props.split(',') if p.strip()}
+        bad = sorted(requested.difference(_state_fields))
+        if bad:
+            resp.data = PropertyResponse(None, req,
+                                         InvalidValueException(f'Unknown state properties: {", ".join(bad)}')).data
+            return
+        # 去重并按 _state_fields 的固定顺序排列：读合并的键最多 2^7 种，与请求里的写法无关
+        names = tuple(n for n in _state_fields if n in requested) if requested else tuple(_state_fields)
+
+        try:
+            if Config.read_coalesce > 0:
+                tmpl = _read_cache.get(devnum, ('state',) + names, lambda st: _state_value(st, names))
+                if tmpl is None:
+                    resp.data = PropertyResponse(None, req, NotConnectedException()).data
+                else:
+                    resp.data = tmpl.render(req)
+                return
+            st = rot_devs[devnum].snapshot
+            if not st.connected:
+                resp.data = PropertyResponse(None, req, NotConnectedException()).data
+                return
+            value = _state_value(st, names)
+            resp.data = PropertyResponse(value, req).data
+        except Exception as ex:
+            resp.data = PropertyResponse(None, req,
+                                         DriverException(0x500, 'Rotator.State failed', ex)).data
+
+# 非标准扩展：Server-Sent Events 推送设备状态，代替 ismoving/position 轮询
+# GET /api/v1/rotator/{devnum}/stream
+# 每次状态发布推送一条 "event: state"，数据与 state 端点的 Value 相同；慢的订阅者
+# 醒来时只拿最新快照，中间的变化被合并。WSGI 模式下每个订阅占用一个 worker 线程，
+# 同时订阅的数量受 [limits] max_streams 限制（超出返回 503，wsgiref 不提供）；
+# ASGI 模式下订阅者只是事件循环里的一个协程，不受限制。
+_STREAM_HEARTBEAT = 15.0  # 没有变化时多久发一次注释行，用来发现断开的连接
+
+def _stream_timeout(dev, st) -> float:
+    # 解析模型没有后台步进、运动中不会发布快照，需要按步进间隔自己取
+    if st.is_moving:
+        return min(dev.step_interval, _STREAM_HEARTBEAT)
+    return _STREAM_HEARTBEAT
+
+def _stream_event(st) -> bytes:
+    return b'event: state\ndata: ' + json.dumps(_state_value(st, _state_fields)).encode() + b'\n\n'
+
+def _stream_sync(dev):
+    last, last_sent = None, 0.0
+    version = dev.version
+    while True:
+        st = dev.snapshot
+        now = time.monotonic()
+        if st != last:
+            last, last_sent = st, now
+            yield _stream_event(st)
+        elif now - last_sent >= _STREAM_HEARTBEAT:
+            last_sent = now
+            yield b': heartbeat\n\n'
+        version = dev.wait_for_change(version, _stream_timeout(dev, st))
+
+async def _stream_async(dev):
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def wake():
+        # 在设备锁内被调用，只做线程安全的投递
+        try:
+            loop.call_soon_threadsafe(changed.set)
+        except RuntimeError:  # 事件循环已关闭
+            pass
+
+    dev.add_listener(wake)
+    try:
+        last, last_sent = None, 0.0
+        while True:
+            changed.clear()
+            st = dev.snapshot
+            now = time.monotonic()
+            if st != last:
+                last, last_sent = st, now
+                yield _stream_event(st)
+            elif now - last_sent >= _STREAM_HEARTBEAT:
+                last_sent = now
+                yield b': heartbeat\n\n'
+            try:
+                await asyncio.wait_for(changed.wait(), _stream_timeout(dev, st))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        dev.remove_listener(wake)
+
+@before(PreProcessRequest(maxdev))
+class stream:
+    def on_get(self, req: Request, resp: Response, devnum: int):
+        dev = rot_devs[devnum]
+        if not dev.snapshot.connected:
+            resp.data = PropertyResponse(None, req, NotConnectedException()).data
+            return
+        resp.content_type = 'text/event-stream'
+        resp.set_header('Cache-Control', 'no-cache')
+        if isinstance(req, falcon.asgi.Request):
+            resp.stream = _stream_async(dev)
             return
+        admission.streams.acquire()
+        resp.stream = admission.streams.hold(_stream_sync(dev))
+
+# 非标准扩展：长轮询等待运动结束，代替 move 之后循环查询 ismoving
+# GET /api/v1/rotator/{devnum}/waitmove?Timeout=30[&Threshold=123.4]
+# 运动结束、位置越过 Threshold 或等待 Timeout 秒后返回，Value 为 state 端点的
+# 全部字段再加上 TimedOut。等待期间占用一个 worker 线程，同时等待的数量受
+# [limits] max_waits 限制（超出返回 503，wsgiref 不提供）。
+_WAITMOVE_MAX_TIMEOUT = 60.0
+
+@before(PreProcessRequest(maxdev))
+class waitmove:
+    def on_get(self, req: Request, resp: Response, devnum: int):
+        dev = rot_devs[devnum]
+        if not dev.snapshot.connected:
+            resp.data = PropertyResponse(None, req, NotConnectedException()).data
+            return
+
+        tmo_str = get_request_field('Timeout', req, default='30')
+        thr_str = get_request_field('Threshold', req, default='')
+        try:
+            timeout = float(tmo_str)
+            threshold = float(thr_str) if thr_str != '' else None
+        except ValueError:
+            resp.data = PropertyResponse(None, req,
+                                         InvalidValueException(f'Invalid Timeout={tmo_str} / Threshold={thr_str}')).data
+            return
+        if timeout < 0.0 or timeout > _WAITMOVE_MAX_TIMEOUT:
+            resp.data = PropertyResponse(None, req,
+                                         InvalidValueException(f'Timeout out of range: {timeout}')).data
+            return
+        if threshold is not None and (threshold < 0.0 or threshold >= 360.0):
+            resp.data = PropertyResponse(None, req,
+                                         InvalidValueException(f'Threshold out of range: {threshold}')).data
+            return
+
+        admission.waits.acquire()
         try:
-            tp = rot_dev.target_position
-            resp.text = PropertyResponse(tp, req).json
+            st, timed_out = dev.wait_for_motion(timeout, threshold)
+            value = _state_value(st, _state_fields)
+            value['TimedOut'] = timed_out
+            resp.data = PropertyResponse(value, req).data
         except Exception as ex:
-            resp.text = PropertyResponse(None, req,
-                                         DriverException(0x500, 'Rotator.TargetPosition failed', ex)).json
+            resp.data = PropertyResponse(None, req,
+                                         DriverException(0x500, 'Rotator.WaitMove failed', ex)).data
+        finally:
+            admission.waits.release()
+
+# 非标准扩展：[device] move_queue > 0 时，运动中收到的 move / moveabsolute / movemechanical
+# 不再报错，而是排队在当前运动结束后依次执行（连续的绝对目标合并为最后一个，halt 清空队列）
+# GET /api/v1/rotator/{devnum}/movequeue 返回排队的数量和队列容量
+@before(PreProcessRequest(maxdev))
+class movequeue:
+    def on_get(self, req: Request, resp: Response, devnum: int):
+        st = rot_devs[devnum].snapshot
+        if not st.connected:
+            resp.data = PropertyResponse(None, req, NotConnectedException()).data
+            return
+        resp.data = PropertyResponse({'Depth': st.queued, 'Capacity': Config.move_queue}, req).data
 
 @before(PreProcessRequest(maxdev))
 class halt:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = MethodResponse(req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = MethodResponse(req, NotConnectedException()).data
             return
         try:
-            rot_dev.Halt()
-            resp.text = MethodResponse(req).json
+            dev.Halt()
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.Halt failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.Halt failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class move:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = MethodResponse(req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = MethodResponse(req, NotConnectedException()).data
             return
         pos_str = get_request_field('Position', req)
         try:
             delta = float(pos_str)
         except:
-            resp.text = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).data
             return
 
         # 简单做个归约
@@ -240,82 +527,117 @@ class move:
             delta -= 360.0
 
         try:
-            rot_dev.Move(delta)
-            resp.text = MethodResponse(req).json
+            dev.Move(delta)
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.Move failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.Move failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class moveabsolute:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = MethodResponse(req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = MethodResponse(req, NotConnectedException()).data
             return
         pos_str = get_request_field('Position', req)
         try:
             newpos = float(pos_str)
         except:
-            resp.text = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).data
             return
 
         if newpos < 0.0 or newpos >= 360.0:
-            resp.text = MethodResponse(req, InvalidValueException(f'Position out of range: {newpos}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Position out of range: {newpos}')).data
             return
 
         try:
-            rot_dev.MoveAbsolute(newpos)
-            resp.text = MethodResponse(req).json
+            dev.MoveAbsolute(newpos)
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.MoveAbsolute failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.MoveAbsolute failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class movemechanical:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = MethodResponse(req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = MethodResponse(req, NotConnectedException()).data
             return
 
         pos_str = get_request_field('Position', req)
         try:
             newpos = float(pos_str)
         except:
-            resp.text = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).data
             return
 
         if newpos < 0.0 or newpos >= 360.0:
-            resp.text = MethodResponse(req, InvalidValueException(f'Position out of range: {newpos}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Position out of range: {newpos}')).data
             return
 
         try:
-            rot_dev.MoveMechanical(newpos)
-            resp.text = MethodResponse(req).json
+            dev.MoveMechanical(newpos)
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.MoveMechanical failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.MoveMechanical failed', ex)).data
 
 @before(PreProcessRequest(maxdev))
 class sync:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        if not rot_dev.connected:
-            resp.text = MethodResponse(req, NotConnectedException()).json
+        dev = rot_devs[devnum]
+        if not dev.connected:
+            resp.data = MethodResponse(req, NotConnectedException()).data
             return
 
         pos_str = get_request_field('Position', req)
         try:
             newpos = float(pos_str)
         except:
-            resp.text = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Invalid Position={pos_str}')).data
             return
 
         if newpos < 0.0 or newpos >= 360.0:
-            resp.text = MethodResponse(req, InvalidValueException(f'Position out of range: {newpos}')).json
+            resp.data = MethodResponse(req, InvalidValueException(f'Position out of range: {newpos}')).data
             return
 
         try:
-            rot_dev.Sync(newpos)
-            resp.text = MethodResponse(req).json
+            dev.Sync(newpos)
+            resp.data = MethodResponse(req).data
         except Exception as ex:
-            resp.text = MethodResponse(req,
-                                       DriverException(0x500, 'Rotator.Sync failed', ex)).json
+            resp.data = MethodResponse(req,
+                                       DriverException(0x500, 'Rotator.Sync failed', ex)).data
+
+# 需要注册路由的 resource 类，endpoint 名为类名（main.init_routes 使用）。
+# 新增 resource 时记得加到这里；启动时不再用 inspect 反射整个模块
+ROUTES = (
+    action,
+    commandblind,
+    commandbool,
+    commandstring,
+    description,
+    driverinfo,
+    interfaceversion,
+    driverversion,
+    name,
+    supportedactions,
+    canreverse,
+    connected,
+    ismoving,
+    mechanicalposition,
+    position,
+    reverse,
+    stepsize,
+    targetposition,
+    state,
+    stream,
+    waitmove,
+    movequeue,
+    halt,
+    move,
+    moveabsolute,
+    movemechanical,
+    sync,
+)
@@ -6,18 +6,110 @@
 #
 # MIT License
 # -----------------------------------------------------------------------------
-from threading import Timer, Lock
+import time
+from collections import deque
+from threading import Lock, Condition
 from logging import Logger
+from typing import NamedTuple
+
+import metrics
+import trajectory
+from motion import scheduler
+
+class RotatorState(NamedTuple):
+    """
+    设备状态的不可变快照。每次状态变化后整体替换 RotatorDevice._published，
+    读取方无需加锁，且一次读取得到的各字段彼此一致。
+    """
+    position: float
+    mechanical_position: float
+    target_position: float
+    is_moving: bool
+    connected: bool
+    reverse: bool
+    offset: float
+    queued: int = 0         # 排队等待执行的 move 数（move_queue 模式）
+
+def _wrap360(angle: float) -> float:
+    angle %= 360.0
+    return 0.0 if angle >= 360.0 else angle
+
+def _shortest_delta(frm: float, to: float) -> float:
+    delta = to - frm
+    if delta < -180.0:
+        delta += 360.0
+    if delta >= 180.0:
+        delta -= 360.0
+    return delta
+
+def _arc_contains(frm: float, to: float, angle: float) -> bool:
+    """
+    angle 是否落在从 frm 沿最短路径转到 to 的弧上（含端点）
+    """
+    span = _shortest_delta(frm, to)
+    off = _shortest_delta(frm, angle)
+    if span >= 0:
+        return 0.0 <= off <= span
+    return span <= off <= 0.0
+
+class _Move(NamedTuple):
+    """
+    解析运动模型下的一次运动：从 t0 时刻的 start 机械角开始，
+    以 rate 度/秒沿最短路径转过 delta 度。
+    chained 为 True 表示后面还有排队的 move，到达后仍视为运动中，直到下一段开始。
+    profile 不是 constant 时 rate 是最高速度，按 accel 加减速，位置查运动开始时生成的 path
+    """
+    t0: float
+    start: float
+    delta: float
+    rate: float
+    duration: float
+    chained: bool = False
+    profile: str = 'constant'
+    accel: float = 0.0
+    path: trajectory.Trajectory = None
+
+    def mech_at(self, now: float):
+        """
+        返回 (机械角, 是否仍在运动)
+        """
+        elapsed = now - self.t0
+        if elapsed >= self.duration:
+            return _wrap360(self.start + self.delta), self.chained
+        if self.path is None:
+            travelled = self.rate * elapsed
+        else:
+            travelled = self.path.at(elapsed)
+        if self.delta < 0:
+            travelled = -travelled
+        return _wrap360(self.start + travelled), True
+
+def project_state(state: RotatorState, move: _Move) -> RotatorState:
+    """
+    解析模型运动中时，把发布的状态按当前时间推算到此刻
+    """
+    if move is None:
+        return state
+    mech, moving = move.mech_at(time.monotonic())
+    return state._replace(mechanical_position=mech,
+                          position=_wrap360(mech + state.offset),
+                          is_moving=moving)
 
 class RotatorDevice:
-    def __init__(self, logger: Logger):
-        self._lock = Lock()
+    def __init__(self, logger: Logger, analytic: bool = False, step_size: float = 1.0,
+                 steps_per_sec: float = 6, can_reverse: bool = True, move_queue: int = 0,
+                 profile: str = 'constant', acceleration: float = 0.0):
+        # 命令路径的加锁经过 metrics.timed_lock 统计等待时间；Condition 直接使用底层锁
+        raw_lock = Lock()
+        self._lock = metrics.timed_lock(raw_lock)
         self.logger = logger
 
-        # 设备配置
-        self._can_reverse = True
-        self._step_size = 1.0
-        self._steps_per_sec = 6
+        # 设备配置（来自 config.toml [device]，可由 configure() 在运行中修改）
+        self._can_reverse = can_reverse
+        self._step_size = step_size
+        self._steps_per_sec = steps_per_sec
+        self._queue_max = move_queue
+        self._accel = acceleration
 
         # 设备状态
         self._reverse = False
@@ -27,10 +119,30 @@ class RotatorDevice:
         self._is_moving = False
         self._connected = False
 
-        # 定时器
-        self._timer = None
+        # 步进由全局 MotionScheduler 驱动，_gen 用来作废 stop() 之前排好的步进
         self._interval = 1.0 / self._steps_per_sec
         self._stopped = True
+        self._gen = 0
+
+        # 解析模型：不做任何后台步进，读取时按 _move 记录的起点/速率直接算出位置
+        # profile 为 trapezoid / scurve 时按加速度限制的速度曲线运动（只用于解析模型）
+        self._analytic = analytic
+        self._profile = profile if analytic else 'constant'
+        self._move: _Move = None
+
+        # 运动中收到的 move：(是否绝对目标, 机械角目标)，当前运动结束后依次执行
+        self._queue = deque()
+
+        # 状态变化通知：_version 每次发布加一，_changed 与 _lock 共用同一把锁；
+        # _listeners 是发布时要回调的函数（例如唤醒 asyncio 订阅者），写时复制
+        self._version = 0
+        self._changed = Condition(raw_lock)
+        self._listeners = ()
+
+        # (RotatorState, _Move) 作为一个整体发布，读取方一次取到一致的状态和运动记录
+        self._published = None
+        with self._lock:
+            self._publish()
 
     def _pos_to_mech(self, pos: float) -> float:
         mech = pos - self._pos_offset
@@ -48,15 +160,169 @@ class RotatorDevice:
             pos += 360.0
         return pos
 
-    def start(self, from_run: bool = False):
+    def _publish(self):
+        """
+        生成新的状态快照并原子地替换，然后通知等待者和订阅者（调用方需持有 _lock）
+        """
+        state = RotatorState(
+            position=self._mech_to_pos(self._mech_pos),
+            mechanical_position=self._mech_pos,
+            target_position=self._mech_to_pos(self._tgt_mech_pos),
+            is_moving=self._is_moving,
+            connected=self._connected,
+            reverse=self._reverse,
+            offset=self._pos_offset,
+            queued=len(self._queue)
+        )
+        self._published = (state, self._move)
+        self._version += 1
+        self._changed.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    @property
+    def version(self) -> int:
+        """
+        已发布快照的序号，每次状态变化加一
+        """
+        return self._version
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        阻塞直到发布序号不再等于 version 或超时，返回当前序号。
+        等待期间中间的多次变化会合并成一次（只关心最新快照）
+        """
+        with self._lock:
+            if self._version == version:
+                self._changed.wait(timeout)
+            return self._version
+
+    def wait_for_motion(self, timeout: float, threshold: float = None):
+        """
+        阻塞直到运动结束（到达目标或 Halt）、位置越过 threshold 或超时。
+        返回 (最后的快照, 是否超时)
+        """
+        deadline = time.monotonic() + timeout
+        prev = None
+        while True:
+            version = self.version
+            st = self.snapshot
+            if not st.is_moving:
+                return st, False
+            if threshold is not None and \
+                    _arc_contains(st.position if prev is None else prev.position, st.position, threshold):
+                return st, False
+            prev = st
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return st, True
+            # 解析模型运动中不发布快照，按步进间隔重新计算位置
+            if self._analytic:
+                remaining = min(remaining, self.step_interval)
+            self.wait_for_change(version, remaining)
+
+    def add_listener(self, callback):
+        """
+        每次发布快照时（持有设备锁）调用 callback()，回调必须非常轻量且不能阻塞
+        """
         with self._lock:
-            if from_run or self._stopped:
+            self._listeners = self._listeners + (callback,)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            self._listeners = tuple(cb for cb in self._listeners if cb is not callback)
+
+    @property
+    def snapshot(self) -> RotatorState:
+        """
+        最近一次发布的状态快照，不加锁，不会被运动线程阻塞。
+        解析模型运动中时，按当前时间算出位置再返回。
+        """
+        state, move = self._published
+        return project_state(state, move)
+
+    @property
+    def published(self):
+        """
+        (RotatorState, _Move) 原始发布值，供跨进程共享时整体写出
+        """
+        return self._published
+
+    def _settle(self):
+        """
+        解析模型：把当前时刻的位置写回 _mech_pos，运动已结束则清除运动记录（调用方需持有 _lock）
+        """
+        if self._move is None:
+            return
+        self._mech_pos, self._is_moving = self._move.mech_at(time.monotonic())
+        if not self._is_moving:
+            self._move = None
+            self._stopped = True
+
+    def start(self):
+        with self._lock:
+            if self._analytic:
+                self._stopped = False
+                self._begin_analytic(time.monotonic(), self._mech_pos)
+                self._publish()
+                return
+            if self._stopped:
                 self._stopped = False
-                self._timer = Timer(self._interval, self._run)
-                self._timer.start()
+                self._gen += 1
+                deadline = time.monotonic() + self._interval
+                scheduler.call_at(deadline, self._run, self._gen, deadline)
 
-    def _run(self):
+    def _begin_analytic(self, t0: float, start: float):
+        """
+        解析模型：从 t0 时刻的 start 开始向 _tgt_mech_pos 运动；有排队的 move 时
+        在到达时刻安排 _advance 接着执行下一段（调用方需持有 _lock）
+        """
+        delta = _shortest_delta(start, self._tgt_mech_pos)
+        rate = self._step_size * self._steps_per_sec
+        if self._profile == 'constant':
+            path, duration = None, abs(delta) / rate
+        else:
+            path = trajectory.build(self._profile, abs(delta), rate, self._accel)
+            duration = path.duration
+        self._move = _Move(t0=t0, start=start, delta=delta, rate=rate, duration=duration,
+                           chained=bool(self._queue), profile=self._profile, accel=self._accel, path=path)
+        if self._move.chained:
+            scheduler.call_at(t0 + self._move.duration, self._advance, self._move)
+
+    def _advance(self, move: _Move):
+        """
+        解析模型：一段运动到达，开始队列里的下一段。下一段从上一段的到达时刻算起，
+        回调的延迟不会让位置落后
+        """
+        with self._lock:
+            if self._move is not move:     # 已被 Halt 或 configure 替换
+                return
+            end = move.t0 + move.duration
+            self._mech_pos = _wrap360(move.start + move.delta)
+            if self._queue:
+                _, self._tgt_mech_pos = self._queue.popleft()
+                self._begin_analytic(end, self._mech_pos)
+            else:
+                self._move = None
+                self._stopped = True
+                self._is_moving = False
+            self._publish()
+
+    def _chain(self):
+        """
+        解析模型：当前这段运动原来没有后续，现在有了排队的 move（调用方需持有 _lock）
+        """
+        move = self._move
+        if move is not None and not move.chained:
+            self._move = move._replace(chained=True)
+            scheduler.call_at(move.t0 + move.duration, self._advance, self._move)
+
+    def _run(self, gen: int, deadline: float):
+        if metrics.enabled:
+            metrics.step_jitter.observe(time.monotonic() - deadline)
         with self._lock:
+            if gen != self._gen:
+                return
             delta = self._tgt_mech_pos - self._mech_pos
             if delta < -180.0:
                 delta += 360.0
@@ -74,40 +340,69 @@ class RotatorDevice:
                     self._mech_pos -= self._step_size
                     if self._mech_pos < 0.0:
                         self._mech_pos += 360.0
+            elif self._queue:
+                # 到达后接着执行排队的下一个 move，这一步算作停顿
+                _, self._tgt_mech_pos = self._queue.popleft()
             else:
                 self._is_moving = False
                 self._stopped = True
+            self._publish()
 
-        if self._is_moving:
-            self.start(from_run=True)
+            if self._is_moving:
+                # 下一步的截止时间从本步的截止时间推算，回调的延迟不会累积；
+                # 落后超过一步（例如机器过载）时放弃追赶，从当前时间重新对齐
+                next_deadline = deadline + self._interval
+                now = time.monotonic()
+                if next_deadline < now - self._interval:
+                    next_deadline = now
+                scheduler.call_at(next_deadline, self._run, gen, next_deadline)
 
     def stop(self):
         with self._lock:
+            self._settle()
+            self._move = None
+            self._queue.clear()
             self._stopped = True
             self._is_moving = False
-            if self._timer is not None:
-                self._timer.cancel()
-            self._timer = None
+            self._gen += 1
+            self._publish()
+
+    def configure(self, step_size: float, steps_per_sec: float, can_reverse: bool, move_queue: int = 0,
+                  acceleration: float = 0.0):
+        """
+        一次性替换设备配置（配置热加载时调用）。
+        步进模式下从下一步开始按新的步长/频率运动；解析模型下正在进行的运动从当前位置按新速率重新计时
+        （加减速曲线从静止重新开始）。move_queue 调小时已经排队的 move 保留
+        """
+        with self._lock:
+            self._settle()
+            self._step_size = step_size
+            self._steps_per_sec = steps_per_sec
+            self._interval = 1.0 / steps_per_sec
+            self._can_reverse = can_reverse
+            self._queue_max = move_queue
+            self._accel = acceleration
+            if self._move is not None:
+                self._begin_analytic(time.monotonic(), self._mech_pos)
+            self._publish()
 
     @property
     def can_reverse(self) -> bool:
-        with self._lock:
-            return self._can_reverse
+        return self._can_reverse
 
     @property
     def reverse(self) -> bool:
-        with self._lock:
-            return self._reverse
+        return self.snapshot.reverse
 
     @reverse.setter
     def reverse(self, value: bool):
         with self._lock:
             self._reverse = value
+            self._publish()
 
     @property
     def step_size(self) -> float:
-        with self._lock:
-            return self._step_size
+        return self._step_size
 
     @step_size.setter
     def step_size(self, val: float):
@@ -116,8 +411,7 @@ class RotatorDevice:
 
     @property
     def steps_per_sec(self) -> int:
-        with self._lock:
-            return self._steps_per_sec
+        return self._steps_per_sec
 
     @steps_per_sec.setter
     def steps_per_sec(self, val: int):
@@ -125,76 +419,98 @@ class RotatorDevice:
             self._steps_per_sec = val
             self._interval = 1.0 / self._steps_per_sec
 
+    @property
+    def step_interval(self) -> float:
+        """
+        两次步进之间的秒数（不加锁）
+        """
+        return self._interval
+
     @property
     def position(self) -> float:
-        with self._lock:
-            return self._mech_to_pos(self._mech_pos)
+        return self.snapshot.position
 
     @property
     def mechanical_position(self) -> float:
-        with self._lock:
-            return self._mech_pos
+        return self.snapshot.mechanical_position
 
     @property
     def target_position(self) -> float:
-        with self._lock:
-            return self._mech_to_pos(self._tgt_mech_pos)
+        return self.snapshot.target_position
 
     @property
     def is_moving(self) -> bool:
-        with self._lock:
-            return self._is_moving
+        return self.snapshot.is_moving
 
     @property
     def connected(self) -> bool:
-        with self._lock:
-            return self._connected
+        return self.snapshot.connected
 
     @connected.setter
     def connected(self, value: bool):
         with self._lock:
+            self._settle()
             if (not value) and self._connected and self._is_moving:
                 raise RuntimeError('Cannot disconnect while rotator is moving')
             self._connected = value
+            self._publish()
         if value:
             self.logger.info('[connected]')
         else:
             self.logger.info('[disconnected]')
 
+    def _request_move(self, target_of, absolute: bool) -> bool:
+        """
+        开始一次运动，或在运动中把它放进队列（调用方需持有 _lock）。
+        target_of(base) 由运动的起点机械角算出目标机械角；排队时起点是前一个 move 的目标。
+        返回是否需要调用 start()
+        """
+        self._settle()
+        if not self._is_moving:
+            self._is_moving = True
+            self._tgt_mech_pos = target_of(self._mech_pos)
+            self._publish()
+            return True
+        if not self._queue_max:
+            raise RuntimeError('Rotator is already moving')
+        if absolute and self._queue and self._queue[-1][0]:
+            # 连续的绝对目标只保留最后一个
+            self._queue[-1] = (True, target_of(None))
+        elif len(self._queue) >= self._queue_max:
+            raise RuntimeError(f'Move queue is full ({self._queue_max} pending)')
+        else:
+            base = self._queue[-1][1] if self._queue else self._tgt_mech_pos
+            self._queue.append((absolute, target_of(base)))
+        if self._analytic:
+            self._chain()
+        self._publish()
+        return False
+
     def Move(self, delta_pos: float):
-        self.logger.debug(f'[Move] delta={delta_pos}')
+        self.logger.debug('[Move] delta=%s', delta_pos)
         with self._lock:
-            if self._is_moving:
-                raise RuntimeError('Rotator is already moving')
-            self._is_moving = True
-            self._tgt_mech_pos = self._mech_pos + delta_pos - self._pos_offset
-            if self._tgt_mech_pos >= 360.0:
-                self._tgt_mech_pos -= 360.0
-            if self._tgt_mech_pos < 0.0:
-                self._tgt_mech_pos += 360.0
-        self.start()
+            started = self._request_move(lambda base: _wrap360(base + delta_pos - self._pos_offset), False)
+        if started:
+            self.start()
 
     def MoveAbsolute(self, pos: float):
-        self.logger.debug(f'[MoveAbs] pos={pos}')
+        self.logger.debug('[MoveAbs] pos=%s', pos)
         with self._lock:
-            if self._is_moving:
-                raise RuntimeError('Rotator is already moving')
-            self._is_moving = True
-            self._tgt_mech_pos = self._pos_to_mech(pos)
-        self.start()
+            started = self._request_move(lambda base: self._pos_to_mech(pos), True)
+        if started:
+            self.start()
 
     def MoveMechanical(self, pos: float):
-        self.logger.debug(f'[MoveMech] pos={pos}')
+        self.logger.debug('[MoveMech] pos=%s', pos)
         with self._lock:
-            if self._is_moving:
-                raise RuntimeError('Rotator is already moving')
-            self._is_moving = True
-            self._tgt_mech_pos = pos
-        self.start()
+            started = self._request_move(lambda base: pos, True)
+        if started:
+            self.start()
 
     def Sync(self, pos: float):
-        self.logger.debug(f'[Sync] pos={pos}')
+        self.logger.debug('[Sync] pos=%s', pos)
         with self._lock:
+            self._settle()
             if self._is_moving:
                 raise RuntimeError('Cannot sync while moving')
             self._pos_offset = pos - self._mech_pos
@@ -202,6 +518,7 @@ class RotatorDevice:
                 self._pos_offset += 360.0
             if self._pos_offset >= 180.0:
                 self._pos_offset -= 360.0
+            self._publish()
 
     def Halt(self):
         self.logger.debug('[Halt]')
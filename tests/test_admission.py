@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_admission.py - Request priority under saturation
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import sys
+import time
+from threading import Thread, Event
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from falcon import App
+from falcon.testing import TestClient
+
+import admission
+import config
+from config import Config
+
+class _Resource:
+    def __init__(self, order: list, hold: Event):
+        self._order = order
+        self._hold = hold
+
+    def on_get(self, req, resp, name: str):
+        self._order.append(f'GET {name}')
+        if name == 'slow':
+            self._hold.wait(5.0)
+
+    def on_put(self, req, resp, name: str):
+        self._order.append(f'PUT {name}')
+
+def _wait_until(cond, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+def test_put_overtakes_queued_gets(monkeypatch):
+    # 一个名额：slow GET 占住它，后面的 GET 和 PUT 都在 worker 线程里等名额
+    gate = admission.PriorityGate(1)
+    monkeypatch.setattr(admission, 'gate', gate)
+    order, hold = [], Event()
+    app = App(middleware=[admission.AdmissionMiddleware()])
+    app.add_route('/{name}', _Resource(order, hold))
+    client = TestClient(app)
+
+    def call(method: str, name: str):
+        client.simulate_request(method, f'/{name}')
+
+    threads = [Thread(target=call, args=('GET', 'slow'))]
+    threads[0].start()
+    _wait_until(lambda: order == ['GET slow'])
+    for i in range(3):
+        threads.append(Thread(target=call, args=('GET', f'poll{i}')))
+        threads[-1].start()
+    _wait_until(lambda: gate.queued() == (0, 3))
+    threads.append(Thread(target=call, args=('PUT', 'halt')))
+    threads[-1].start()
+    _wait_until(lambda: gate.queued() == (1, 3))
+
+    hold.set()
+    for t in threads:
+        t.join(5.0)
+    assert order[:2] == ['GET slow', 'PUT halt']
+    assert sorted(order[2:]) == ['GET poll0', 'GET poll1', 'GET poll2']
+    assert gate.queued() == (0, 0)
+
+@pytest.mark.parametrize('server, threads, active, ok', [
+    ('threaded', 8, 0, True),
+    ('threaded', 8, 7, True),
+    ('threaded', 8, 8, False),
+    ('asgi', 4, 6, False),
+    ('wsgiref', 8, 1, False),
+])
+def test_active_requests_must_leave_workers_to_queue_on(server, threads, active, ok):
+    cfg = type('Cfg', (Config,), {'server': server, 'threads': threads, 'active_requests': active,
+                                  'max_streams': 0, 'max_waits': 0})
+    if ok:
+        config.validate(cfg)
+    else:
+        with pytest.raises(ValueError, match='active_requests'):
+            config.validate(cfg)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_configwatcher.py - Hot reload validation
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import sys
+import logging
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import config
+import configwatcher
+from config import Config
+
+@pytest.fixture
+def reload_with(monkeypatch):
+    monkeypatch.setattr(configwatcher, 'logger', logging.getLogger('test'))
+    monkeypatch.setattr(Config, 'server', 'threaded')
+    monkeypatch.setattr(Config, 'threads', 8)
+    monkeypatch.setattr(Config, 'max_streams', 0)
+    monkeypatch.setattr(Config, 'max_waits', 2)
+
+    def reload(**fields):
+        monkeypatch.setattr(config, 'read_config', lambda: type('_New', (Config,), fields))
+        return configwatcher.reload()
+    return reload
+
+def test_live_limits_are_checked_against_running_threads(reload_with):
+    # 文件里同时把 threads 调到 16：新线程数重启后才生效，运行中仍是 8 个 worker
+    assert not reload_with(threads=16, max_waits=10)
+    assert Config.max_waits == 2 and Config.threads == 8
+
+def test_live_limits_within_running_threads_apply(reload_with):
+    assert reload_with(threads=16, max_waits=6)
+    assert Config.max_waits == 6 and Config.threads == 8
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_logpolicy.py - Token bucket and per-key policy state
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import sys
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import logpolicy
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_sub_one_rate_admits_one_request_per_period(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(logpolicy.time, 'monotonic', clock)
+    limit = logpolicy.RateLimit(0.5)
+    assert limit.on_request('a')            # 满桶（容量 1）放行第一个
+    assert not limit.on_request('a')
+    clock.now += 1.0
+    assert not limit.on_request('a')        # 半个令牌
+    clock.now += 1.0
+    assert limit.on_request('a')            # 2 秒补满一个
+    assert not limit.on_request('a')
+
+def test_rate_allows_burst_of_rate_then_refills(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(logpolicy.time, 'monotonic', clock)
+    limit = logpolicy.RateLimit(3.0)
+    assert [limit.on_request('a') for _ in range(4)] == [True, True, True, False]
+    assert limit.on_request('b')            # 各键互不影响
+    clock.now += 1.0 / 3.0
+    assert limit.on_request('a')
+
+@pytest.mark.parametrize('spec, attr', [('every:2', '_count'), ('change', '_last'), ('rate:1', '_buckets')])
+def test_per_key_state_is_bounded(spec, attr):
+    # 设备编号校验之前就按 (remote_addr, path) 记录，任意路径不能让字典无限增长
+    policy = logpolicy.parse_policy(spec)
+    for i in range(logpolicy.MAX_KEYS * 3):
+        key = ('10.0.0.1', f'/api/v1/rotator/{i}/position')
+        if policy.on_request(key) is None:
+            policy.on_value(key, i)
+    assert 0 < len(getattr(policy, attr)) <= logpolicy.MAX_KEYS
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_multiproc.py - Shared-memory seqlock between owner and workers
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import re
+import sys
+import struct
+import logging
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import multiproc
+from rotatordevice import RotatorDevice
+
+class _FieldwiseStruct:
+    """
+    代替 struct.Struct：pack_into 逐个字段写入，每写一个字段拍一次内存快照，
+    模拟读方在写方 memcpy 中途读取（字段之间的任意时刻都可能被看到）
+    """
+
+    def __init__(self, real: struct.Struct, snapshots: list):
+        self._real = real
+        self._snapshots = snapshots
+        self.size = real.size
+        self._fields = []
+        for count, code in re.findall(r'(\d*)([a-zA-Z?])', real.format[1:]):
+            self._fields += [struct.Struct('<' + code)] * int(count or 1)
+
+    def unpack_from(self, buf, off=0):
+        return self._real.unpack_from(buf, off)
+
+    def pack_into(self, buf, off, *values):
+        for field, value in zip(self._fields, values):
+            field.pack_into(buf, off, value)
+            off += field.size
+            self._snapshots.append(bytes(buf))
+
+def _read_slot(raw: bytes):
+    """
+    用新的 SharedRotator 读一个内存快照；seq 为奇数（写方正在写）时返回 None
+    """
+    if multiproc._SEQ.unpack_from(raw, 0)[0] & 1:
+        return None
+    version, state, _ = multiproc.SharedRotator(bytearray(raw), 0, None)._read()
+    return multiproc._SEQ.unpack_from(raw, 0)[0], version, state
+
+def test_even_seq_never_pairs_with_stale_version(monkeypatch):
+    dev = RotatorDevice(logging.getLogger('test'))
+    shared = bytearray(multiproc.SLOT_SIZE)
+    writer = multiproc.SharedStateWriter(shared, 0, dev)
+    before = _read_slot(bytes(shared))
+
+    snapshots = []
+    for name in ('_HDR', '_BODY', '_SEQ'):
+        monkeypatch.setattr(multiproc, name, _FieldwiseStruct(getattr(multiproc, name), snapshots))
+    dev.reverse = True      # 设备发布新快照，listener 写共享内存
+    monkeypatch.undo()
+    after = _read_slot(bytes(shared))
+
+    assert after[0] == before[0] + 2 and after[1] != before[1] and after[2].reverse
+    # 读方能接受的每个中间状态（偶数 seq）必须整体等于发布前或发布后
+    seen = [r for r in map(_read_slot, snapshots) if r is not None]
+    assert seen and all(r in (before, after) for r in seen)
+    assert seen[-1] == after
+
+def test_publish_read_round_trip():
+    dev = RotatorDevice(logging.getLogger('test'), analytic=True, step_size=1.0, steps_per_sec=2,
+                        can_reverse=False, move_queue=2, profile='trapezoid', acceleration=4.0)
+    shared = multiproc.create_shared(2)
+    writer = multiproc.SharedStateWriter(shared, 1, dev)
+    dev.connected = True
+    dev.Move(90.0)
+    dev.Move(10.0)
+
+    rotator = multiproc.SharedRotator(shared, 1, None)
+    version, state, move = rotator._read()
+    published, expected = dev.published
+    assert version == dev.version and state == published
+    assert move[:8] == expected[:8]     # 运动参数一致，采样表在读方自己生成
+    assert move.path.duration == pytest.approx(expected.path.duration)
+    assert (rotator.step_size, rotator.steps_per_sec, rotator.can_reverse, rotator._analytic) == (1.0, 2, False, True)
+    assert rotator._read()[2] is move      # seq 未变时复用上次的解析结果
+
+    dev.Halt()
+    version, state, move = rotator._read()
+    assert version == dev.version and move is None
+    assert state == dev.published[0] and state.queued == 0 and not state.is_moving
+    # 另一个槽没有被写过
+    assert multiproc._HDR.unpack_from(memoryview(shared).cast('B'), 0) == (0, 0)
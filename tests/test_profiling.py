@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_profiling.py - Profiling sessions with overlapping requests
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import sys
+import time
+import logging
+from threading import Thread, Barrier
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from falcon import App
+from falcon.testing import TestClient
+
+import profiling
+
+class _Slow:
+    def on_get(self, req, resp):
+        time.sleep(0.05)
+        resp.media = {'ok': True}
+
+@pytest.fixture
+def session(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)     # 采集结束时写出的文件放在临时目录
+    monkeypatch.setattr(profiling, 'logger', logging.getLogger('test'))
+    profiling.start(max_requests=1000)
+    yield
+    profiling._session = None
+
+def _concurrent_gets(client: TestClient, n: int) -> list:
+    barrier = Barrier(n)
+    codes = []
+
+    def call():
+        barrier.wait()
+        codes.append(client.simulate_get('/slow').status_code)
+
+    threads = [Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+    return codes
+
+def _client() -> TestClient:
+    app = App(middleware=[profiling.ProfilingMiddleware()])
+    app.add_route('/slow', _Slow())
+    return TestClient(app)
+
+def test_overlapping_requests_are_served_and_skipped(session):
+    codes = _concurrent_gets(_client(), 6)
+    assert codes == [200] * 6
+    st = profiling.status()
+    assert st['Requests'] >= 1 and st['Skipped'] >= 1
+    assert st['Requests'] + st['Skipped'] == 6
+
+def test_profiler_already_active_is_skipped(session, monkeypatch):
+    # Python 3.12+ 在另有 profiler 启用时 enable() 抛 ValueError
+    class _Busy:
+        def enable(self):
+            raise ValueError('Another profiling tool is already active')
+
+    monkeypatch.setattr(profiling.cProfile, 'Profile', _Busy)
+    assert _concurrent_gets(_client(), 3) == [200] * 3
+    assert profiling.status()['Skipped'] == 3
+    assert not profiling._profiling.locked()
+
+def test_profile_call_serializes(session):
+    codes = []
+    threads = [Thread(target=lambda: codes.append(profiling.profile_call(lambda: time.sleep(0.05) or 200)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+    assert codes == [200] * 4
+    st = profiling.status()
+    assert st['Requests'] + st['Skipped'] == 4
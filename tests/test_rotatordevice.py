@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_rotatordevice.py - Move queue depth and order
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import sys
+import time
+import logging
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from rotatordevice import RotatorDevice
+
+def _device(analytic: bool, degrees_per_sec: float, move_queue: int) -> RotatorDevice:
+    return RotatorDevice(logging.getLogger('test'), analytic=analytic, step_size=10.0,
+                         steps_per_sec=degrees_per_sec / 10.0, move_queue=move_queue)
+
+def _wait_stopped(dev: RotatorDevice, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while dev.is_moving:
+        assert time.monotonic() < deadline, 'rotator did not stop'
+        time.sleep(0.01)
+
+def test_without_queue_second_move_is_rejected():
+    dev = _device(True, 1.0, 0)
+    dev.Move(90.0)
+    with pytest.raises(RuntimeError, match='already moving'):
+        dev.Move(10.0)
+    dev.Halt()
+
+def test_queue_depth_merge_and_halt():
+    dev = _device(True, 1.0, 2)     # 1°/s，测试期间第一个 move 不会结束
+    dev.Move(90.0)
+    dev.Move(10.0)
+    dev.MoveAbsolute(200.0)
+    assert dev.snapshot.queued == 2
+    # 连续的绝对目标合并成最后一个，不占新的名额
+    dev.MoveAbsolute(250.0)
+    assert dev.snapshot.queued == 2
+    assert list(dev._queue) == [(False, 100.0), (True, 250.0)]
+    with pytest.raises(RuntimeError, match=r'queue is full \(2 pending\)'):
+        dev.Move(5.0)
+    dev.Halt()
+    assert dev.snapshot.queued == 0 and not dev.is_moving
+
+@pytest.mark.parametrize('analytic', [True, False], ids=['analytic', 'stepping'])
+def test_queued_moves_run_in_order(analytic):
+    dev = _device(analytic, 1000.0, 3)
+    targets = []
+    dev.add_listener(lambda: targets.append(dev.published[0].target_position))
+    dev.Move(30.0)
+    dev.Move(30.0)                  # 相对 move 从前一个目标算起
+    dev.MoveAbsolute(100.0)
+    dev.Move(-80.0)
+    _wait_stopped(dev)
+    visited = [t for i, t in enumerate(targets) if i == 0 or t != targets[i - 1]]
+    assert visited == [30.0, 60.0, 100.0, 20.0]
+    assert dev.position == pytest.approx(20.0) and dev.snapshot.queued == 0
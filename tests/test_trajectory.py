@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# test_trajectory.py - Acceleration-limited motion profiles
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+#   python -m pytest tests
+#
+import os
+import sys
+
+# config.py 从 sys.path[0] 读取 config.toml，这里指向仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import trajectory
+
+VMAX = 6.0
+ACCEL = 12.0
+
+# (profile, 距离)：90° 有匀速段，2° 来不及加速到 VMAX（三角形）
+CASES = [('trapezoid', 90.0), ('trapezoid', 2.0), ('scurve', 90.0), ('scurve', 2.0)]
+
+def _peak_velocity(path: trajectory.Trajectory) -> float:
+    return max((x1 - x0) / (t1 - t0) for t0, t1, x0, x1 in
+               zip(path.times, path.times[1:], path.offsets, path.offsets[1:]))
+
+@pytest.mark.parametrize('profile, distance', CASES)
+def test_endpoints_and_monotonic(profile, distance):
+    path = trajectory.build(profile, distance, VMAX, ACCEL)
+    assert path.at(0.0) == 0.0
+    assert path.at(path.duration) == distance
+    assert path.at(path.duration + 1.0) == distance
+    assert all(x0 <= x1 for x0, x1 in zip(path.offsets, path.offsets[1:]))
+
+@pytest.mark.parametrize('profile, distance', CASES)
+def test_peak_velocity_and_duration(profile, distance):
+    vpeak, ta, tc, total = trajectory.plan(profile, distance, VMAX, ACCEL)
+    path = trajectory.build(profile, distance, VMAX, ACCEL)
+    assert total == pytest.approx(2.0 * ta + tc)
+    assert path.duration == pytest.approx(total)
+    assert vpeak <= VMAX
+    assert _peak_velocity(path) == pytest.approx(vpeak, rel=0.01)
+    if distance == 90.0:
+        assert vpeak == VMAX and tc > 0.0
+    else:
+        assert vpeak < VMAX and tc == 0.0
+
+def test_trapezoid_duration_closed_form():
+    # 有匀速段时：总时长 = 距离 / vmax + vmax / accel
+    _, ta, _, total = trajectory.plan('trapezoid', 90.0, VMAX, ACCEL)
+    assert ta == pytest.approx(VMAX / ACCEL)
+    assert total == pytest.approx(90.0 / VMAX + VMAX / ACCEL)
+
+def test_constant_and_zero_distance():
+    assert trajectory.plan('constant', 90.0, VMAX, ACCEL) == (VMAX, 0.0, 15.0, 15.0)
+    path = trajectory.build('trapezoid', 0.0, VMAX, ACCEL)
+    assert path.duration == 0.0 and path.at(1.0) == 0.0
+
+@pytest.mark.skipif(trajectory.numpy is None, reason='NumPy not installed')
+@pytest.mark.parametrize('profile, distance', CASES)
+def test_numpy_matches_python(profile, distance):
+    vpeak, ta, _, total = trajectory.plan(profile, distance, VMAX, ACCEL)
+    times = [total * i / 100 for i in range(101)]
+    args = (profile, times, distance, vpeak, ta, total)
+    assert trajectory._offsets_numpy(*args) == pytest.approx(trajectory._offsets_python(*args))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# trajectory.py - Precomputed acceleration-limited motion profiles
+#
+# Part of the MyAlpacaDriver sample device driver
+#
+# MIT License
+# -----------------------------------------------------------------------------
+# 解析运动模型的速度曲线：
+#   constant   匀速（原来的 analytic 模型），不建表，直接按 rate × t 计算
+#   trapezoid  梯形速度：以 acceleration 匀加速到最高速度，匀速，再匀减速；距离太短时为三角形
+#   scurve     S 形速度：加减速段的速度按 smoothstep（3u² - 2u³）变化，加速度连续，
+#              峰值加速度等于 acceleration
+# 一次运动开始时把整条曲线（时间 -> 已转过的角度，0..distance）一次算成表，挂在
+# rotatordevice._Move 上，之后读取位置只是对时间表二分查找再线性插值，O(log n)，
+# 运动线程不做任何逐步计算。方向、起点和 360° 回绕由 _Move 处理。
+# 多进程模式下各 worker 在共享内存里看到新的运动时，按其参数自己建一次表。
+# 装了 NumPy 时用向量化计算生成表，否则用纯 Python，结果相同。
+#
+import math
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PROFILES = ('constant', 'trapezoid', 'scurve')
+
+SAMPLE_RATE = 1000.0    # 每秒的采样点数
+MIN_SAMPLES = 32
+MAX_SAMPLES = 4096
+
+def _ramp(profile: str, vmax: float, accel: float):
+    """
+    返回 (加速段时长, 加速段走过的距离)
+    """
+    if profile == 'scurve':
+        ta = 1.5 * vmax / accel     # smoothstep 的峰值斜率是 1.5
+    else:
+        ta = vmax / accel
+    return ta, 0.5 * vmax * ta
+
+def plan(profile: str, distance: float, vmax: float, accel: float):
+    """
+    返回 (峰值速度, 加速段时长, 匀速段时长, 总时长)；距离不够加速到 vmax 时没有匀速段
+    """
+    if distance <= 0.0:
+        return 0.0, 0.0, 0.0, 0.0
+    if profile == 'constant' or accel <= 0.0:
+        return vmax, 0.0, distance / vmax, distance / vmax
+    ta, da = _ramp(profile, vmax, accel)
+    if 2.0 * da <= distance:
+        tc = (distance - 2.0 * da) / vmax
+        return vmax, ta, tc, 2.0 * ta + tc
+    # 三角形：加速段距离与峰值速度的平方成正比
+    vpeak = vmax * math.sqrt(distance / (2.0 * da))
+    ta, _ = _ramp(profile, vpeak, accel)
+    return vpeak, ta, 0.0, 2.0 * ta
+
+def _offsets_python(profile: str, times: list, distance: float, vpeak: float, ta: float, total: float) -> list:
+    scurve = profile == 'scurve'
+
+    def ramp(t):
+        u = t / ta
+        if scurve:
+            return vpeak * ta * (u ** 3 - 0.5 * u ** 4)
+        return 0.5 * vpeak * ta * u * u
+
+    out = []
+    for t in times:
+        if t < ta:
+            out.append(ramp(t))
+        elif t > total - ta:
+            out.append(distance - ramp(total - t))
+        else:
+            out.append(ramp(ta) + vpeak * (t - ta))
+    return out
+
+def _offsets_numpy(profile: str, times: list, distance: float, vpeak: float, ta: float, total: float) -> list:
+    t = numpy.asarray(times)
+    up = numpy.minimum(t, ta) / ta
+    down = numpy.clip(total - t, 0.0, ta) / ta
+    if profile == 'scurve':
+        ramp_up = up ** 3 - 0.5 * up ** 4
+        ramp_down = down ** 3 - 0.5 * down ** 4
+    else:
+        ramp_up = 0.5 * up * up
+        ramp_down = 0.5 * down * down
+    half = vpeak * ta * 0.5
+    cruise = numpy.clip(t - ta, 0.0, None) * vpeak
+    # 加速段 / 匀速段 / 减速段一次算出，再按时间段选取
+    offsets = numpy.where(t < ta, vpeak * ta * ramp_up,
+                          numpy.where(t > total - ta, distance - vpeak * ta * ramp_down, half + cruise))
+    return offsets.tolist()
+
+class Trajectory:
+    """
+    times[i] 时刻已转过 offsets[i] 度（不带方向）
+    """
+    __slots__ = ('times', 'offsets', 'duration')
+
+    def __init__(self, times: list, offsets: list):
+        self.times = times
+        self.offsets = offsets
+        self.duration = times[-1]
+
+    def at(self, t: float) -> float:
+        if t <= 0.0:
+            return 0.0
+        if t >= self.duration:
+            return self.offsets[-1]
+        i = bisect.bisect_right(self.times, t)
+        t0, t1 = self.times[i - 1], self.times[i]
+        x0, x1 = self.offsets[i - 1], self.offsets[i]
+        return x0 + (x1 - x0) * (t - t0) / (t1 - t0)
+
+def build(profile: str, distance: float, vmax: float, accel: float) -> Trajectory:
+    """
+    生成整条曲线的采样表，运动开始时调用一次
+    """
+    if distance <= 0.0:
+        return Trajectory([0.0], [0.0])
+    vpeak, ta, _, total = plan(profile, distance, vmax, accel)
+    n = min(MAX_SAMPLES, max(MIN_SAMPLES, int(total * SAMPLE_RATE)))
+    times = [total * i / n for i in range(n + 1)]
+    offsets = (_offsets_numpy if numpy is not None else _offsets_python)(profile, times, distance, vpeak, ta, total)
+    offsets[-1] = distance    # 终点精确等于目标，避免浮点误差
+    return Trajectory(times, offsets)